@@ -0,0 +1,374 @@
+#Benchmarks for the converters on synthetic posting batches
+#
+#   python benchmark.py                          # 10k and 100k records, results saved in benchmark_results/
+#   python benchmark.py --sizes 1000000 10000000 # bigger runs (10M records is tens of GB of JSON)
+#   python benchmark.py --compare benchmark_results/benchmark-20250101-120000.json
+#
+# Every pipeline runs in its own process so its peak RSS can be measured (Linux/macOS).
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+SIZES = [10000, 100000]
+PIPELINES = ['json_to_excel5', 'json_sql_excel', 'stages', 'sql_stages']
+STAGES = ['parse', 'extract', 'encode', 'timestamp_format', 'validate', 'width_autosize', 'excel_write']
+SQL_STAGES = ['extract', 'store_write', 'sql_report', 'excel_write']  # the steps of json_sql_excel.py
+RESULTS_DIR = 'benchmark_results'
+REGRESSION_FACTOR = 1.2  # slower than this many times the previous result counts as a regression
+NOISE_SECONDS = 0.05  # timings below this are too small to compare
+START_MS = 1735682400000  # 2025-01-01 in epoch milliseconds
+
+DENOMINATIONS = (['EGP', 'GBP', 'USD'], [97, 2, 1])
+ACCOUNT_TYPES = ['CASA', 'TD', 'LOAN', 'CREDIT_CARD']
+EVENTS = ['ACCRUE_INTEREST_AND_DAILY_FEES', 'ACCRUE_INTEREST', 'APPLY_ACCRUED_INTEREST', 'MONTHLY_FEES']
+ADDRESSES = ['DEFAULT', 'ACCRUED_DEPOSIT_PAYABLE', 'ACCRUED_INTEREST_RECEIVABLE', 'INTEREST_PAID']
+
+
+def _uuid(rng):
+    text = '%032x' % rng.getrandbits(128)
+    return f'{text[:8]}-{text[8:12]}-{text[12:16]}-{text[16:20]}-{text[20:]}'
+
+
+def _postings(rng, amount, denomination):
+    """A balanced debit/credit pair"""
+    return [{
+        'credit': credit,
+        'amount': amount,
+        'denomination': denomination,
+        'account_id': 'ACCRUED_INTEREST_PAYABLE' if not credit else _uuid(rng),
+        'account_address': rng.choice(ADDRESSES),
+        'asset': 'COMMERCIAL_BANK_MONEY',
+        'phase': 'POSTING_PHASE_COMMITTED',
+        'internal_account_processing_label': '',
+    } for credit in (False, True)]
+
+
+def _instruction(rng, timestamp):
+    amount = '%.5f' % rng.uniform(0.01, 50000)
+    postings = _postings(rng, amount, rng.choices(*DENOMINATIONS)[0])
+    # most instructions have committed postings that repeat the custom ones, like the real dumps
+    shape = rng.choices(['committed', 'custom_only', 'four_postings', 'null_custom'], [88, 2, 2, 8])[0]
+    committed = [] if shape == 'custom_only' else postings * 2 if shape == 'four_postings' else postings
+    if rng.random() < 0.9:
+        account_id = postings[1]['account_id']
+        details = [{'key': 'account_type', 'value': rng.choice(ACCOUNT_TYPES)},
+                   {'key': 'description', 'value': f'Daily interest accrued at 0.00384% on balance of {amount}.'},
+                   {'key': 'event', 'value': rng.choice(EVENTS)},
+                   {'key': 'originating_account_id', 'value': account_id}]
+    else:
+        details = [{'key': 'creditor_account_id', 'value': _uuid(rng)},
+                   {'key': 'debitor_account_id', 'value': _uuid(rng)},
+                   {'key': 'transaction_type', 'value': 'TRANSFER'}]
+    return {
+        'id': _uuid(rng),
+        'client_transaction_id': f'ACCRUE_INTEREST_{_uuid(rng)}_{timestamp}',
+        'outbound_authorisation': None,
+        'inbound_authorisation': None,
+        'settlement': None,
+        'transfer': None,
+        'custom_instruction': None if shape == 'null_custom' else {'postings': postings},
+        'pics': [],
+        'instruction_details': details,
+        'committed_postings': committed,
+        'posting_violations': [],
+        'account_violations': [],
+        'restriction_violations': [],
+        'contract_violations': [],
+        'override': {'restrictions': {'all': True, 'restriction_set_ids': []}},
+        'transaction_code': None,
+        'booking_localised_date_time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp // 1000)),
+    }
+
+
+def generate_records(count, seed=0):
+    """Yield count synthetic records shaped like the posting_instruction_batch export
+
+    Batches mostly hold one instruction (sometimes 2-3), instructions have committed
+    postings, custom_instruction postings (null for some), or only custom ones, and
+    instruction_details with an account_type or transfer keys.
+    """
+    rng = random.Random(seed)
+    for idx in range(count):
+        timestamp = START_MS + idx * 1000 + rng.randrange(1000)
+        batch_id = _uuid(rng)
+        instructions = [_instruction(rng, timestamp) for _ in range(rng.choices([1, 2, 3], [92, 7, 1])[0])]
+        yield {
+            'posting_instruction_batch': {
+                'id': batch_id,
+                'create_request_id': _uuid(rng),
+                'client_id': 'CoreContracts',
+                'client_batch_id': f'ACCRUE_INTEREST_AND_DAILY_FEES_{batch_id}',
+                'posting_instructions': instructions,
+                'batch_details': [],
+                'value_timestamp': timestamp,
+                'booking_timestamp': timestamp,
+                'status': 'POSTING_INSTRUCTION_BATCH_STATUS_ACCEPTED',
+                'error': None,
+                'insertion_timestamp': timestamp,
+                'dry_run': False,
+            },
+            'event_id': _uuid(rng),
+            'timestamp': timestamp,
+            'change_id': str(idx),
+            'balances': [{'account_id': p['account_id'], 'amount': p['amount'], 'denomination': p['denomination']}
+                         for p in instructions[0]['committed_postings']],
+        }
+
+
+def write_input(path, count, seed=0, ndjson=False):
+    """Write count synthetic records to path as a JSON array (like out.json) or as NDJSON"""
+    with open(path, 'w') as f:
+        if not ndjson:
+            f.write('[')
+        for idx, record in enumerate(generate_records(count, seed)):
+            if idx and not ndjson:
+                f.write(',\n')
+            f.write(json.dumps(record))
+            if ndjson:
+                f.write('\n')
+        if not ndjson:
+            f.write(']')
+
+
+def measure_stages(path, chunk_size=50000):
+    """Time each stage of json_to_excel5.py separately on path, returns {stage: seconds}
+
+    The chunks go through the steps of json_extract.extract_chunk one by one, encode is the
+    typed and dictionary encoding. Excel writing is timed without width tracking,
+    width_autosize measures the same chunks on their own.
+    """
+    sys.path.insert(0, REPO)
+    from json_reader import iter_records
+    from json_extract import (RECORD_FIELDS, ANOMALY_COLUMN, column_order, format_timestamps, _extract,
+                              anomaly_column, encode_categories, encode_typed)
+    from json_sinks import ColumnWidths, ExcelSink
+    from json_to_excel5 import VALIDATE
+    from json_validate import Validator
+
+    timings = dict.fromkeys(STAGES, 0.0)
+    records = iter_records(path, fields=RECORD_FIELDS)
+    widths = ColumnWidths(column_order)
+    validator = Validator(column_order) if VALIDATE else None
+    with tempfile.TemporaryDirectory() as tmp:
+        sink = ExcelSink(os.path.join(tmp, 'stages.xlsx'), column_order, width_sample_rows=0)
+        while True:
+            started = time.perf_counter()
+            batch = list(itertools.islice(records, chunk_size))
+            parsed = time.perf_counter()
+            if not batch:
+                break
+            anomalies = [] if VALIDATE else None
+            columns = _extract(batch, anomalies)
+            if VALIDATE:
+                columns[ANOMALY_COLUMN] = anomaly_column(anomalies, len(batch))
+            extracted = time.perf_counter()
+            encode_typed(columns)
+            typed = time.perf_counter()
+            readable = format_timestamps(columns['value_timestamp'])
+            columns['readable_value_date'] = columns['readable_booking_date'] = readable
+            formatted = time.perf_counter()
+            encode_categories(columns)
+            encode_typed(columns)
+            encoded = time.perf_counter()
+            if validator is not None:
+                validator.update(columns)
+            validated = time.perf_counter()
+            widths.update([columns[column] for column in column_order])
+            sized = time.perf_counter()
+            sink.write(columns)
+            written = time.perf_counter()
+            timings['parse'] += parsed - started
+            timings['extract'] += extracted - parsed
+            timings['encode'] += (typed - extracted) + (encoded - formatted)
+            timings['timestamp_format'] += formatted - typed
+            timings['validate'] += validated - encoded
+            timings['width_autosize'] += sized - validated
+            timings['excel_write'] += written - sized
+        started = time.perf_counter()
+        sink.close()
+        timings['excel_write'] += time.perf_counter() - started
+    return timings
+
+
+def measure_sql_stages(path):
+    """Time each stage of json_sql_excel.py separately on path, returns {stage: seconds}
+
+    store_write includes building the indexes when the store is closed, sql_report is the
+    'transactions' report read into pandas and excel_write its export with column widths.
+    """
+    sys.path.insert(0, REPO)
+    import pandas as pd
+    from openpyxl.utils import get_column_letter
+    from json_extract import column_order
+    from json_sinks import longest_text, MAX_COLUMN_WIDTH
+    from json_store import SqliteSink, run_report
+    from json_to_excel5 import iter_extracted
+
+    timings = dict.fromkeys(SQL_STAGES, 0.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store_path = os.path.join(tmp, 'stages.db')
+        chunks = iter_extracted(path)
+        store = SqliteSink(store_path, column_order)
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            extracted = time.perf_counter()
+            timings['extract'] += extracted - started
+            if chunk is None:
+                break
+            store.write(chunk)
+            timings['store_write'] += time.perf_counter() - extracted
+        started = time.perf_counter()
+        store.close()
+        loaded = time.perf_counter()
+        result = run_report(store_path, 'transactions')
+        reported = time.perf_counter()
+        with pd.ExcelWriter(os.path.join(tmp, 'stages.xlsx'), engine='openpyxl') as writer:
+            result.to_excel(writer, index=False, sheet_name='Transactions')
+            for col_idx, column in enumerate(result):
+                width = min(max(longest_text(result[column].tolist()), len(column)) + 2, MAX_COLUMN_WIDTH)
+                writer.sheets['Transactions'].column_dimensions[get_column_letter(col_idx + 1)].width = width
+        timings['store_write'] += loaded - started
+        timings['sql_report'] += reported - loaded
+        timings['excel_write'] += time.perf_counter() - reported
+    return timings
+
+
+def _run(args, cwd):
+    """Run a child process, returns (seconds, peak RSS in MB, stdout)"""
+    started = time.perf_counter()
+    proc = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE)
+    output = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.perf_counter() - started
+    if proc.returncode:
+        raise RuntimeError(f"{' '.join(args)} failed with exit code {proc.returncode}")
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+    return seconds, usage.ru_maxrss * scale / (1 << 20), output.decode()
+
+
+def run_pipeline(name, input_path, workdir):
+    """Run one pipeline on input_path inside workdir, returns a result dict"""
+    if name == 'json_to_excel5':
+        code = (f'import sys; sys.path.insert(0, {REPO!r}); import json_to_excel5 as m; '
+                f'm.INPUT_FILE = {input_path!r}; m.OUTPUT_FILES = ["bench.xlsx"]; m.CACHE = False; m.main()')
+        seconds, rss, _ = _run([sys.executable, '-c', code], workdir)
+    elif name == 'json_sql_excel':
+        # the script reads out.json and keeps transactions.db in the working directory
+        for leftover in ('out.json', 'transactions.db'):
+            if os.path.lexists(os.path.join(workdir, leftover)):
+                os.remove(os.path.join(workdir, leftover))
+        os.symlink(os.path.abspath(input_path), os.path.join(workdir, 'out.json'))
+        seconds, rss, _ = _run([sys.executable, os.path.join(REPO, 'json_sql_excel.py')], workdir)
+    else:
+        flag = '--stages' if name == 'stages' else '--sql-stages'
+        seconds, rss, output = _run([sys.executable, os.path.abspath(__file__), flag, input_path], workdir)
+        return {'pipeline': name, 'seconds': seconds, 'peak_rss_mb': round(rss, 1),
+                'stages': json.loads(output.strip().splitlines()[-1])}
+    return {'pipeline': name, 'seconds': seconds, 'peak_rss_mb': round(rss, 1)}
+
+
+def _timings(results):
+    """Flatten results into {(size, name): seconds}, stages named like 'stages.parse'"""
+    flat = {}
+    for result in results:
+        flat[(result['size'], result['pipeline'])] = result['seconds']
+        for stage, seconds in result.get('stages', {}).items():
+            flat[(result['size'], f"{result['pipeline']}.{stage}")] = seconds
+    return flat
+
+
+def compare(results, previous, factor=REGRESSION_FACTOR):
+    """Print new timings next to previous ones, returns the (size, name) keys that got slower than factor"""
+    new, old = _timings(results), _timings(previous)
+    regressions = []
+    print(f"\n{'size':>10}  {'measurement':<28}{'before':>10}{'now':>10}{'ratio':>8}")
+    for key in sorted(new.keys() & old.keys()):
+        ratio = new[key] / old[key] if old[key] else float('inf')
+        slower = ratio > factor and new[key] >= NOISE_SECONDS
+        if slower:
+            regressions.append(key)
+        print(f"{key[0]:>10}  {key[1]:<28}{old[key]:>10.3f}{new[key]:>10.3f}{ratio:>8.2f}"
+              f"{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the converters on synthetic posting batches')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='record counts to run')
+    parser.add_argument('--pipelines', nargs='+', default=PIPELINES, choices=PIPELINES)
+    parser.add_argument('--ndjson', action='store_true', help='generate NDJSON instead of a JSON array')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', help='previous results file to compare against')
+    parser.add_argument('--output', help='where to save the results (default: benchmark_results/benchmark-<time>.json)')
+    parser.add_argument('--stages', metavar='INPUT', help=argparse.SUPPRESS)  # used for the stages child process
+    parser.add_argument('--sql-stages', metavar='INPUT', help=argparse.SUPPRESS)  # and for the sql_stages one
+    args = parser.parse_args()
+
+    if args.stages:
+        print(json.dumps(measure_stages(args.stages)))
+        return
+    if args.sql_stages:
+        print(json.dumps(measure_sql_stages(args.sql_stages)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            input_path = os.path.join(workdir, f'synthetic_{size}.{"ndjson" if args.ndjson else "json"}')
+            started = time.perf_counter()
+            write_input(input_path, size, args.seed, args.ndjson)
+            print(f"{size} records: generated {os.path.getsize(input_path) / (1 << 20):.0f} MB "
+                  f"in {time.perf_counter() - started:.1f} s")
+            for name in args.pipelines:
+                result = run_pipeline(name, input_path, workdir)
+                result['size'] = size
+                result['records_per_sec'] = round(size / result['seconds'])
+                results.append(result)
+                print(f"  {name:<16}{result['seconds']:8.2f} s {result['peak_rss_mb']:8.0f} MB peak "
+                      f"{result['records_per_sec']:>10} records/s")
+                for stage, seconds in result.get('stages', {}).items():
+                    print(f"    {stage:<18}{seconds:8.2f} s")
+            os.remove(input_path)
+
+    summary = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'ndjson': args.ndjson,
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime('benchmark-%Y%m%d-%H%M%S.json'))
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print("Results saved to", output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)['results'])
+        if regressions:
+            print(f"{len(regressions)} measurement(s) more than {REGRESSION_FACTOR}x slower")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#Summary tables: debit and credit totals of amount per group, added up while the rows are written
+import json
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+
+DAY = 'day'  # group key for the local date (TIMEZONE) of value_timestamp, taken from readable_value_date
+STAT_COLUMNS = ['debit_count', 'debit_total', 'debit_min', 'debit_max',
+                'credit_count', 'credit_total', 'credit_min', 'credit_max', 'net_total']
+_ZERO = Decimal(0)
+_SUM_LIMIT = 2 ** 62  # fixed point sums of a chunk stay in int64 below this
+
+
+def _hashable(values):
+    """values, with the lists and dicts among them as JSON text so they can be group keys"""
+    if isinstance(values, list):
+        try:
+            hash(tuple(values))
+        except TypeError:
+            return [json.dumps(value, sort_keys=True, default=str) if isinstance(value, (list, dict)) else value
+                    for value in values]
+    return values
+
+
+class Aggregator:
+    """count/sum/min/max of amount split by credit, for every combination of the key columns
+
+    Keys are output columns, or 'day'. Groups live in one dict, so memory grows with the
+    number of groups and not with the rows. Amounts are added up as Decimal, so totals
+    are exact until they are written. Fixed point amounts (json_columns.AmountColumn) are
+    added up per chunk with numpy, in exact int64 units, before they go into the groups.
+    A row whose credit isn't True or False is on neither side, it is counted in unknown_credit.
+    """
+
+    def __init__(self, name, keys, columns):
+        missing = [key for key in keys if key != DAY and key not in columns]
+        missing += [column for column in ('credit', 'amount') if column not in columns]
+        if missing:
+            raise ValueError(f"Summary {name!r} needs columns that are not in the output: {missing}")
+        self.name = name
+        self.keys = list(keys)
+        self.groups = {}  # key tuple -> [debit count, sum, min, max, credit count, sum, min, max]
+        self.bad_amounts = 0
+        self.unknown_credit = 0  # rows with an amount but no True/False credit, on neither side
+
+    def _key_values(self, chunk):
+        for key in self.keys:
+            if key != DAY:
+                yield _hashable(chunk[key])
+            else:
+                # 'YYYY-MM-DD HH:MM:SS.mmm +HHMM' in the configured timezone
+                yield [None if date is None else date[:10] for date in chunk['readable_value_date']]
+
+    def _new_group(self, key):
+        stats = self.groups[key] = [0, _ZERO, None, None, 0, _ZERO, None, None]
+        return stats
+
+    def _update_fixed(self, chunk, units, scale):
+        """update() for fixed point amounts, False when the sums could overflow int64"""
+        credit = chunk['credit']
+        if hasattr(credit, 'flags'):
+            credit, known = credit.flags, ~credit.missing
+        else:
+            known = np.array([type(value) is bool for value in credit], dtype=bool)
+            credit = np.array([value is True for value in credit], dtype=bool)
+        amounts = ~chunk['amount'].missing
+        present = amounts & known
+        values = units[present]
+        if np.abs(values.astype(np.float64)).sum() >= _SUM_LIMIT:
+            return False
+        self.unknown_credit += int((amounts & ~known).sum())
+        lookup = {}
+        group = np.array([lookup.setdefault(key, len(lookup)) for key in zip(*self._key_values(chunk))],
+                         dtype=np.intp)
+        # one slot per group and side: 2 * group for debits, 2 * group + 1 for credits
+        slots = (group * 2 + credit)[present]
+        size = 2 * len(lookup)
+        counts = np.bincount(slots, minlength=size).tolist()
+        totals = np.zeros(size, dtype=np.int64)
+        np.add.at(totals, slots, values)
+        lows = np.full(size, np.iinfo(np.int64).max)
+        np.minimum.at(lows, slots, values)
+        highs = np.full(size, np.iinfo(np.int64).min)
+        np.maximum.at(highs, slots, values)
+        totals, lows, highs = totals.tolist(), lows.tolist(), highs.tolist()
+
+        for key, idx in lookup.items():
+            stats = self.groups.get(key) or self._new_group(key)
+            for side, slot in ((0, 2 * idx), (4, 2 * idx + 1)):
+                if not counts[slot]:
+                    continue
+                low, high = Decimal(lows[slot]).scaleb(-scale), Decimal(highs[slot]).scaleb(-scale)
+                stats[side] += counts[slot]
+                stats[side + 1] += Decimal(totals[slot]).scaleb(-scale)
+                if stats[side + 2] is None or low < stats[side + 2]:
+                    stats[side + 2] = low
+                if stats[side + 3] is None or high > stats[side + 3]:
+                    stats[side + 3] = high
+        return True
+
+    def update(self, chunk):
+        """Add the rows of one chunk of extracted columns"""
+        amounts = chunk['amount']
+        fixed = amounts.fixed_point() if hasattr(amounts, 'fixed_point') else None
+        if fixed is not None and self._update_fixed(chunk, *fixed):
+            return
+        groups = self.groups
+        for key, credit, amount in zip(zip(*self._key_values(chunk)), chunk['credit'], chunk['amount']):
+            stats = groups.get(key) or self._new_group(key)
+            if amount is None:
+                continue
+            try:
+                value = Decimal(amount if isinstance(amount, str) else str(amount))
+            except InvalidOperation:
+                self.bad_amounts += 1
+                continue
+            if not value.is_finite():  # 'NaN', 'sNaN' and 'Infinity' parse but can't be compared or added up
+                self.bad_amounts += 1
+                continue
+            if type(credit) is not bool:
+                self.unknown_credit += 1
+                continue
+            side = 4 if credit else 0
+            stats[side] += 1
+            stats[side + 1] += value
+            if stats[side + 2] is None or value < stats[side + 2]:
+                stats[side + 2] = value
+            if stats[side + 3] is None or value > stats[side + 3]:
+                stats[side + 3] = value
+
+    def columns(self):
+        return self.keys + STAT_COLUMNS
+
+    def rows(self):
+        """One row per group sorted by key (missing keys last), amounts as floats for writing"""
+        rows = []
+        for key in sorted(self.groups, key=lambda key: [(value is None, str(value)) for value in key]):
+            stats = self.groups[key]
+            net = stats[5] - stats[1]
+            rows.append(key + tuple(None if value is None else float(value) if isinstance(value, Decimal) else value
+                                    for value in stats + [net]))
+        return rows
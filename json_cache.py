@@ -0,0 +1,102 @@
+#Cache of extracted columns, so re-running against an unchanged out.json skips parsing it again
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+
+from json_metrics import stage, timed
+
+# under the user's cache directory, not the working directory: entries are a full copy of the extracted data
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                         'json-converter')
+CACHE_VERSION = 1  # format of the entries, bump when what is pickled changes
+# the modules whose code decides what the cached columns hold, any change to them starts a new entry
+CODE_FILES = ('json_reader.py', 'json_spec.py', 'json_extract.py', 'json_columns.py', 'json_query.py',
+              'json_parallel.py', 'json_cache.py')
+CACHE_MAX_BYTES = 2 << 30  # least recently used entries are removed past this total size (2 GiB)
+SAMPLE_BLOCKS = 16  # blocks of the input hashed for the fingerprint, spread evenly over the file
+SAMPLE_SIZE = 1 << 16  # bytes per sampled block (64 KiB)
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """CACHE_VERSION and a hash of the CODE_FILES, so entries extracted by older code aren't used"""
+    digest = hashlib.sha1(str(CACHE_VERSION).encode())
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in CODE_FILES:
+        try:
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(f.read())
+        except OSError:  # installed without its source
+            digest.update(name.encode())
+    return digest.hexdigest()
+
+
+def fingerprint(path, settings=()):
+    """Cache key for path: its size, mtime and a hash of sampled blocks, plus the extraction settings and code
+
+    Hashing a fixed number of blocks keeps this at a few milliseconds whatever the file
+    size. settings must change whenever the extracted columns would (columns, timezone, ...).
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha1(repr((stat.st_size, stat.st_mtime_ns, settings, code_version())).encode())
+    step = max(SAMPLE_SIZE, stat.st_size // SAMPLE_BLOCKS)
+    with open(path, 'rb') as f:
+        for offset in range(0, stat.st_size, step):
+            f.seek(offset)
+            digest.update(f.read(SAMPLE_SIZE))
+        f.seek(max(0, stat.st_size - SAMPLE_SIZE))
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _load(entry):
+    with open(entry, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _evict(cache_dir, max_bytes):
+    """Delete the least recently used entries until the cache fits in max_bytes"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.pickle'):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(os.path.join(cache_dir, name))
+        total -= size
+
+
+def iter_cached(path, extract, settings=(), cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """Yield the extracted chunks of path from the cache, or from extract() while saving them to it
+
+    Each entry is one file of pickled dicts of columns, one per chunk. It only appears
+    once every chunk has been written, so an interrupted run leaves nothing half done.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, fingerprint(path, settings) + '.pickle')
+    if os.path.exists(entry):
+        os.utime(entry)  # mark as recently used
+        yield from timed(_load(entry), 'cache_load')
+        return
+
+    spool = tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False)
+    try:
+        with spool:
+            for chunk in extract():
+                with stage('cache_write'):
+                    pickle.dump(chunk, spool, protocol=pickle.HIGHEST_PROTOCOL)
+                yield chunk
+        os.replace(spool.name, entry)
+    finally:
+        if os.path.exists(spool.name):
+            os.remove(spool.name)
+    _evict(cache_dir, max_bytes)
@@ -0,0 +1,286 @@
+#Typed column buffers: extracted columns held in numpy arrays instead of lists of Python objects
+#
+# 100k amounts as str objects take about 6 MB, as int64 units + int8 scales + a missing mask
+# about 1 MB. The columns still read like lists (len, iteration, indexing and slicing give
+# Python values), so every writer works with them unchanged, and the ones that know about
+# them (Arrow, SQLite timestamps, column widths, summaries, sorting) use the arrays directly.
+import re
+
+import numpy as np
+
+# decimal text that units and scale give back character for character (no '+', '1e3', '01'),
+# one per line so a whole column is checked with a single match
+_DECIMAL = r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]{1,18})?'
+_DECIMAL_LINES = re.compile(rf'(?:{_DECIMAL}\n)*{_DECIMAL}').fullmatch
+_INT64_MAX = np.iinfo(np.int64).max
+_POWERS = 10 ** np.arange(19, dtype=np.int64)
+_NONE = type(None)
+
+
+def _missing_mask(values):
+    """Object array of values with None replaced by 0, and the mask of where None was"""
+    raw = np.array(values, dtype=object)
+    missing = np.equal(raw, None).astype(bool)
+    raw[missing] = 0
+    return raw, missing
+
+
+def _with_gaps(values, missing):
+    """Python list of values with None where missing is set"""
+    for idx in np.flatnonzero(missing).tolist():
+        values[idx] = None
+    return values
+
+
+class TypedColumn:
+    """List-like column backed by numpy arrays, None where a value is missing
+
+    Subclasses hold the arrays; indexing with a slice or picking rows with take() gives
+    another column of the same kind.
+    """
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.missing)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(index)
+        return None if self.missing[index] else self._item(index)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.tolist()!r})'
+
+
+class IntColumn(TypedColumn):
+    """Integers (the epoch timestamps) as int64 with a missing mask"""
+    __slots__ = ('values', 'missing')
+
+    def __init__(self, values, missing):
+        self.values = values
+        self.missing = missing
+
+    @classmethod
+    def encode(cls, values):
+        """Column of values, None when they aren't all int64 integers or None"""
+        if not set(map(type, values)) <= {int, _NONE}:
+            return None
+        raw, missing = _missing_mask(values)
+        try:
+            return cls(raw.astype(np.int64), missing)
+        except OverflowError:
+            return None
+
+    @classmethod
+    def concat(cls, columns):
+        return cls(np.concatenate([column.values for column in columns]),
+                   np.concatenate([column.missing for column in columns]))
+
+    def _item(self, index):
+        return int(self.values[index])
+
+    def take(self, index):
+        return IntColumn(self.values[index], self.missing[index])
+
+    def tolist(self):
+        return _with_gaps(self.values.tolist(), self.missing)
+
+    def longest_text(self):
+        """Length of the longest str(value), None counting as 'None' like everywhere else"""
+        present = self.values[~self.missing]
+        longest = max(len(str(present.min())), len(str(present.max()))) if len(present) else 0
+        return max(longest, 4) if self.missing.any() else longest
+
+
+class BoolColumn(TypedColumn):
+    """True/False (credit) as bits, 8 rows per byte, with a bit-packed missing mask"""
+    __slots__ = ('size', 'bits', 'gaps')
+
+    def __init__(self, flags, missing):
+        self.size = len(flags)
+        self.bits = np.packbits(flags)
+        self.gaps = np.packbits(missing)
+
+    @classmethod
+    def encode(cls, values):
+        """Column of values, None when they aren't all True, False or None"""
+        if not set(map(type, values)) <= {bool, _NONE}:
+            return None
+        raw, missing = _missing_mask(values)
+        return cls(raw.astype(bool), missing)
+
+    @classmethod
+    def concat(cls, columns):
+        return cls(np.concatenate([column.flags for column in columns]),
+                   np.concatenate([column.missing for column in columns]))
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def flags(self):
+        """The values as a bool array, False where missing"""
+        return np.unpackbits(self.bits, count=self.size).astype(bool)
+
+    @property
+    def missing(self):
+        return np.unpackbits(self.gaps, count=self.size).astype(bool)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(index)
+        index = range(self.size)[index]  # IndexError and negative indexes like a list
+        shift = 7 - (index & 7)
+        if (self.gaps[index >> 3] >> shift) & 1:
+            return None
+        return bool((self.bits[index >> 3] >> shift) & 1)
+
+    def take(self, index):
+        return BoolColumn(self.flags[index], self.missing[index])
+
+    def tolist(self):
+        return _with_gaps(self.flags.tolist(), self.missing)
+
+    def longest_text(self):
+        flags, missing = self.flags, self.missing
+        if not (~flags & ~missing).any():  # no 'False'
+            return 4 if self.size else 0
+        return 5
+
+
+def _amount_text(unit, scale):
+    if not scale:
+        return str(unit)
+    digits = str(abs(unit)).rjust(scale + 1, '0')
+    return ('-' if unit < 0 else '') + digits[:-scale] + '.' + digits[-scale:]
+
+
+class AmountColumn(TypedColumn):
+    """Decimal amounts in fixed point: int64 units and the number of decimal places of each
+
+    '12.50' is held as units 1250, scale 2, and comes back as exactly '12.50' again, so
+    outputs are unchanged. fixed_point() and floats() give the whole column for numeric work.
+    """
+    __slots__ = ('units', 'scales', 'missing')
+
+    def __init__(self, units, scales, missing):
+        self.units = units
+        self.scales = scales
+        self.missing = missing
+
+    @classmethod
+    def encode(cls, values):
+        """Parse decimal strings once, None when one of them isn't plain decimal text or has over 18 digits
+
+        The column is parsed as a whole: joined into one line per value, checked with one
+        regular expression and turned into units and scales with array operations on its bytes.
+        """
+        types = set(map(type, values))
+        if not types <= {str, _NONE}:
+            return None
+        missing = np.equal(np.array(values, dtype=object), None).astype(bool)
+        if not len(values):
+            return cls(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8), missing)
+        joined = '\n'.join(['0' if text is None else text for text in values] if _NONE in types else values)
+        if not _DECIMAL_LINES(joined):
+            return None
+        data = np.frombuffer(joined.encode('ascii'), dtype=np.uint8)
+        ends = np.append(np.flatnonzero(data == 10), len(data))  # where each line stops
+        if len(ends) != len(values):
+            return None  # a value with a newline in it
+        digits = np.flatnonzero(data >= 48)  # '0'-'9', the rest is '-', '.' and newlines
+        line = np.searchsorted(ends, digits)
+        counts = np.bincount(line, minlength=len(values))
+        if counts.max() > 18:
+            return None
+        # each digit times 10 to the number of digits after it on its line, added up per line
+        last = np.cumsum(counts)
+        powers = _POWERS[last[line] - np.arange(len(digits)) - 1]
+        units = np.add.reduceat((data[digits] - 48).astype(np.int64) * powers, last - counts)
+        negative = data[np.append(0, ends[:-1] + 1)] == 45
+        if (negative & (units == 0)).any():
+            return None  # '-0.00', which would come back without its sign
+        units[negative] *= -1
+        scales = np.zeros(len(values), dtype=np.int8)
+        points = np.flatnonzero(data == 46)
+        with_point = np.searchsorted(ends, points)
+        scales[with_point] = ends[with_point] - points - 1
+        return cls(units, scales, missing)
+
+    @classmethod
+    def concat(cls, columns):
+        return cls(np.concatenate([column.units for column in columns]),
+                   np.concatenate([column.scales for column in columns]),
+                   np.concatenate([column.missing for column in columns]))
+
+    def _item(self, index):
+        return _amount_text(int(self.units[index]), int(self.scales[index]))
+
+    def take(self, index):
+        return AmountColumn(self.units[index], self.scales[index], self.missing[index])
+
+    def tolist(self):
+        return _with_gaps(list(map(_amount_text, self.units.tolist(), self.scales.tolist())), self.missing)
+
+    def fixed_point(self):
+        """(int64 units, scale) with every amount at the largest scale of the column, 0 where missing
+
+        None when that would overflow int64, e.g. a 16 digit amount next to one with 6 decimal places.
+        """
+        present = ~self.missing
+        scale = int(self.scales[present].max()) if present.any() else 0
+        factors = 10 ** (scale - self.scales.astype(np.int64))
+        units = np.where(present, self.units, 0)
+        if (np.abs(units) > _INT64_MAX // factors).any():
+            return None
+        return units * factors, scale
+
+    def floats(self):
+        """The amounts as float64, NaN where missing"""
+        values = self.units / 10.0 ** self.scales
+        values[self.missing] = np.nan
+        return values
+
+    def longest_text(self):
+        present = ~self.missing
+        units, scales = self.units[present], self.scales[present].astype(np.int64)
+        longest = 0
+        if len(units):
+            digits = np.char.str_len(np.abs(units).astype(str))
+            longest = int((np.maximum(digits, scales + 1) + (scales > 0) + (units < 0)).max())
+        return max(longest, 4) if not present.all() else longest
+
+
+# column kind -> class, for json_extract.TYPED_COLUMNS
+KINDS = {'int64': IntColumn, 'bool': BoolColumn, 'decimal': AmountColumn}
+
+
+def typed_column(values, kind):
+    """Return values as a column of kind ('int64', 'bool' or 'decimal'), or unchanged when they don't fit it"""
+    if isinstance(values, TypedColumn):
+        return values
+    column = KINDS[kind].encode(values)
+    return values if column is None else column
+
+
+def take_rows(values, rows):
+    """Pick the rows (a list or array of positions) out of a column, keeping a typed column typed"""
+    if isinstance(values, TypedColumn):
+        return values.take(np.asarray(rows, dtype=np.intp))
+    if isinstance(rows, np.ndarray):
+        rows = rows.tolist()
+    return [values[idx] for idx in rows]
+
+
+def concat_columns(parts):
+    """Join the chunks of one column, typed when they all are of the same kind, else as one list"""
+    kinds = {type(part) for part in parts}
+    if len(kinds) == 1 and issubclass(next(iter(kinds)), TypedColumn):
+        return next(iter(kinds)).concat(parts)
+    joined = []
+    for part in parts:
+        joined.extend(part)
+    return joined
@@ -0,0 +1,135 @@
+#Compressed inputs and outputs: gzip, bz2 and zstd (zstd needs the zstandard package)
+import bz2
+import gzip
+import io
+import os
+import queue
+import threading
+
+BLOCK_SIZE = 1 << 20  # decompressed bytes handed over by the background thread at a time (1 MiB)
+QUEUE_BLOCKS = 8  # blocks the background thread may run ahead of the parser
+
+# magic bytes at the start of each kind of compressed file
+MAGIC = {
+    b'\x1f\x8b': 'gzip',
+    b'BZh': 'bz2',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+}
+SUFFIXES = {'.gz': 'gzip', '.gzip': 'gzip', '.bz2': 'bz2', '.zst': 'zstd', '.zstd': 'zstd'}
+
+
+def detect_compression(path):
+    """Return 'gzip', 'bz2' or 'zstd' from the first bytes of path, None for an uncompressed file"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    for magic, compression in MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def split_suffix(path):
+    """Split 'out.csv.gz' into ('out.csv', 'gzip'), a path without a compression suffix gives (path, None)"""
+    stem, suffix = os.path.splitext(path)
+    compression = SUFFIXES.get(suffix.lower())
+    return (stem, compression) if compression else (path, None)
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd files need the zstandard package: pip install zstandard") from None
+    return zstandard
+
+
+def _open_stream(path, compression):
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(path, 'rb')
+    if compression == 'zstd':
+        return _zstandard().ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    raise ValueError(f"Unknown compression {compression!r}")
+
+
+class BackgroundReader(io.RawIOBase):
+    """Reads a stream in a background thread, so decompressing overlaps with parsing
+
+    zlib, bz2 and zstd release the GIL while they work, so this gives real parallelism.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.blocks = queue.Queue(QUEUE_BLOCKS)
+        self.block = memoryview(b'')
+        self.finished = False
+        self.stopping = False
+        self.thread = threading.Thread(target=self._fill, daemon=True)
+        self.thread.start()
+
+    def _fill(self):
+        try:
+            while not self.stopping:
+                block = self.stream.read(BLOCK_SIZE)
+                self.blocks.put(block)
+                if not block:
+                    return
+        except Exception as e:  # handed to the reading side
+            self.blocks.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.block:
+            if self.finished:
+                return 0
+            block = self.blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if not block:
+                self.finished = True
+                return 0
+            self.block = memoryview(block)
+        size = min(len(buffer), len(self.block))
+        buffer[:size] = self.block[:size]
+        self.block = self.block[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            # let a thread blocked on a full queue finish, then close the stream under it
+            self.stopping = True
+            while self.thread.is_alive():
+                try:
+                    self.blocks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.stream.close()
+        super().close()
+
+
+def open_decompressed(path, compression=None):
+    """Open a compressed file as a buffered binary stream of its decompressed bytes
+
+    The compression is detected from the magic bytes unless given.
+    """
+    compression = compression or detect_compression(path)
+    return io.BufferedReader(BackgroundReader(_open_stream(path, compression)), BLOCK_SIZE)
+
+
+def open_text_output(path, newline=None, append=False):
+    """Open path for writing text (UTF-8), compressed when it ends in .gz, .bz2 or .zst
+
+    append=True adds to the end of the file, for a compressed file as a new compressed stream.
+    """
+    mode = 'at' if append else 'wt'
+    compression = split_suffix(path)[1]
+    if compression == 'gzip':
+        return gzip.open(path, mode, encoding='utf-8', newline=newline)
+    if compression == 'bz2':
+        return bz2.open(path, mode, encoding='utf-8', newline=newline)
+    if compression == 'zstd':
+        return _zstandard().open(path, mode, encoding='utf-8', newline=newline)
+    return open(path, mode, encoding='utf-8', newline=newline)
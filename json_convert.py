@@ -0,0 +1,232 @@
+#Command line converter: json_to_excel5.py for any number of input files, without editing the script
+#
+#   json-converter out.json                                  # out.xlsx next to where you run it
+#   json-converter exports/ 'archive/**/*.json.gz' -f csv.gz parquet -o converted/
+#   json-converter exports/*.ndjson --merge all_transactions -f xlsx db
+#   json-converter feed.ndjson --follow -f db csv           # keeps adding new lines of a growing file
+#   json-converter out.json --where account_id == 253b780b-... --where value_timestamp '>=' 2025-04-01 \
+#       --columns batch_id credit amount readable_value_date -f csv
+#
+# (`python json_convert.py ...` works the same without installing, `pip install -e .` adds the command)
+# Heavy modules (numpy, pyarrow, openpyxl, pandas) are only imported once a conversion starts,
+# and only those the chosen outputs need.
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from json_compression import split_suffix
+
+INPUT_SUFFIXES = ('.json', '.ndjson', '.jsonl')  # files picked up from a directory, also with .gz, .bz2, .zst
+DEFAULT_FORMATS = ['xlsx']
+
+
+def find_inputs(patterns, recursive=False):
+    """Expand files, directories and glob patterns into a list of input files, each listed once"""
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            walk = os.walk(pattern) if recursive else [(pattern, [], os.listdir(pattern))]
+            for folder, _, names in walk:
+                found += sorted(os.path.join(folder, name) for name in names
+                                if os.path.splitext(split_suffix(name)[0])[1].lower() in INPUT_SUFFIXES)
+        elif os.path.isfile(pattern):
+            found.append(pattern)
+        else:
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+            if not matches:
+                raise ValueError(f"No input files match {pattern!r}")
+            found += matches
+    return list(dict.fromkeys(found))
+
+
+def output_stem(path):
+    """'exports/day1.ndjson.gz' -> 'day1'"""
+    stem, suffix = os.path.splitext(os.path.basename(split_suffix(path)[0]))
+    return stem if suffix.lower() in INPUT_SUFFIXES else stem + suffix
+
+
+def plan_outputs(inputs, formats, output_dir, merge=None):
+    """Return a list of (input files, output files) jobs: one per input, or a single one with merge"""
+    if merge:
+        return [(inputs, [os.path.join(output_dir, f'{merge}.{fmt}') for fmt in formats])]
+    stems = {}
+    for path in inputs:
+        stems.setdefault(output_stem(path), []).append(path)
+    clashes = [paths for paths in stems.values() if len(paths) > 1]
+    if clashes:
+        raise ValueError(f"These inputs would write the same outputs, rename them or use --merge: {clashes[0]}")
+    return [([path], [os.path.join(output_dir, f'{output_stem(path)}.{fmt}') for fmt in formats]) for path in inputs]
+
+
+def filter_value(column, op, text):
+    """The value of a --where filter on column: JSON when it reads as JSON (12, true, null, ["a", "b"]), else text
+
+    Numbers and true/false are only taken as such for the TYPED_COLUMNS, in the text columns
+    they stay text (account_id 12345 is '12345'), like the values they are compared with.
+    'in' and 'not in' also take comma separated text, a,b,c.
+    """
+    from json_extract import TYPED_COLUMNS
+
+    try:
+        value = json.loads(text)
+    except ValueError:
+        value = text
+    if column not in TYPED_COLUMNS:
+        if isinstance(value, list):
+            value = [item if item is None or isinstance(item, str) else json.dumps(item) for item in value]
+        elif value is not None and not isinstance(value, str):
+            value = text
+    if op in ('in', 'not in') and not isinstance(value, list):
+        value = text.split(',')
+    return value
+
+
+def _configure(settings):
+    """Apply the command line settings to json_to_excel5 in this process, returns the module
+
+    TABLE_FILES is a json_sinks setting, so it is set there.
+    """
+    import json_sinks
+    import json_to_excel5
+
+    for name, value in settings.items():
+        setattr(json_sinks if name == 'TABLE_FILES' else json_to_excel5, name, value)
+    return json_to_excel5
+
+
+def convert(job, settings):
+    """Run one conversion job, returns its run summary (with an 'error' instead when it failed)"""
+    input_files, output_files = job
+    converter = _configure(settings)
+    from json_metrics import RunStats
+
+    try:
+        with RunStats(settings.get('PROFILE')) as stats:
+            details = converter.run_full(input_files, output_files)
+        return stats.summary(**details)
+    except Exception as e:  # one bad file shouldn't stop the others
+        return {'input': input_files[0] if len(input_files) == 1 else input_files, 'error': f'{type(e).__name__}: {e}'}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='json-converter',
+        description='Convert posting instruction batch exports (JSON arrays or NDJSON, optionally compressed) '
+                    'to Excel, CSV, NDJSON, Parquet, Arrow or a SQLite store.')
+    parser.add_argument('inputs', nargs='+', help='input files, directories or glob patterns (quote ** patterns)')
+    parser.add_argument('-f', '--format', nargs='+', default=DEFAULT_FORMATS, dest='formats',
+                        help='output formats by extension: xlsx csv ndjson parquet arrow db, '
+                             'csv and ndjson may add .gz/.bz2/.zst (default: xlsx)')
+    parser.add_argument('-o', '--output-dir', default='.', help='where the outputs go (default: current directory)')
+    parser.add_argument('-m', '--merge', metavar='NAME', help='write every input into one set of outputs named NAME')
+    parser.add_argument('-r', '--recursive', action='store_true', help='also look in subdirectories of directories')
+    parser.add_argument('-j', '--jobs', type=int, help='files converted at the same time (default: one per CPU)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='processes extracting one file, used with --merge or --jobs 1 (default: 1)')
+    parser.add_argument('--explode', action='store_true', help='one row per posting instead of per batch')
+    parser.add_argument('--order-by', metavar='COLUMN[:desc]', help='sort the rows, e.g. value_timestamp:desc')
+    parser.add_argument('--where', nargs=3, action='append', metavar=('COLUMN', 'OP', 'VALUE'), default=[],
+                        help='only keep rows where COLUMN OP VALUE holds, OP one of == != < <= > >= in "not in" '
+                             '(quote < and >), timestamps take dates: --where value_timestamp ">=" 2025-04-01')
+    parser.add_argument('--columns', nargs='+', metavar='COLUMN', help='only write these columns, in this order')
+    parser.add_argument('--chunk-size', type=int, help='records extracted at a time')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the extracted columns in ~/.cache/json-converter, a re-run skips parsing')
+    parser.add_argument('--no-cache', dest='cache', action='store_false', help=argparse.SUPPRESS)  # the default
+    parser.add_argument('--no-summaries', action='store_true', help="don't add the SUMMARIES tables to the outputs")
+    parser.add_argument('--no-validate', action='store_true',
+                        help="don't count missing and wrongly typed values or add the Anomalies report")
+    parser.add_argument('--table-files', action='store_true',
+                        help='also write the summaries and the Anomalies report next to csv, ndjson, parquet and '
+                             'arrow outputs as files of their own (workbooks and .db always get them)')
+    parser.add_argument('--follow', action='store_true',
+                        help='keep watching one growing NDJSON file and append new batches until Ctrl+C')
+    parser.add_argument('--idle-exit', type=float, metavar='SECONDS', help='with --follow, stop after no new data')
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], help='add profiling to the summary')
+    parser.add_argument('--summary', metavar='FILE', help='also save the JSON run summary to FILE')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from json_sinks import sink_format
+
+    unknown = [fmt for fmt in args.formats if sink_format('output.' + fmt) is None]
+    if unknown:
+        sys.exit(f"json-converter: unknown output format {unknown[0]!r}")
+    try:
+        inputs = find_inputs(args.inputs, args.recursive)
+        jobs = plan_outputs(inputs, args.formats, args.output_dir, args.merge)
+    except ValueError as e:
+        sys.exit(f"json-converter: {e}")
+    if not inputs:
+        sys.exit("json-converter: no input files found")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.follow:
+        if len(inputs) != 1:
+            sys.exit("json-converter: --follow takes a single input file")
+        if args.where or args.columns:
+            sys.exit("json-converter: --where and --columns can't be used with --follow")
+        from json_follow import follow
+        from json_metrics import RunStats, write_summary
+
+        with RunStats(args.profile) as stats:
+            details = follow(inputs[0], jobs[0][1], explode=args.explode, idle_exit=args.idle_exit)
+        write_summary(stats.summary(**details), args.summary)
+        return
+
+    pool_size = min(args.jobs or os.cpu_count() or 1, len(jobs))
+    settings = {'EXPLODE': args.explode, 'CACHE': args.cache, 'PROFILE': args.profile,
+                # worker processes of a pool can't start their own pool, so files converted side by side are serial
+                'WORKERS': args.workers if pool_size == 1 else 1}
+    if args.order_by:
+        column, _, direction = args.order_by.partition(':')
+        settings['ORDER_BY'] = (column, direction or 'asc')
+    if args.chunk_size:
+        settings['CHUNK_SIZE'] = args.chunk_size
+    if args.where or args.columns:
+        from json_query import Query
+
+        settings['FILTERS'] = [(column, op, filter_value(column, op, text)) for column, op, text in args.where]
+        settings['COLUMNS'] = args.columns
+        try:
+            Query(settings['FILTERS'], args.columns)  # bad columns or operators are reported once, here
+        except ValueError as e:
+            sys.exit(f"json-converter: {e}")
+    if args.no_summaries:
+        settings['SUMMARIES'] = {}
+    if args.no_validate:
+        settings['VALIDATE'] = False
+    if args.table_files:
+        settings['TABLE_FILES'] = True
+
+    started = time.perf_counter()
+    if pool_size == 1:
+        results = [convert(job, settings) for job in jobs]
+    else:
+        with ProcessPoolExecutor(pool_size) as pool:
+            results = list(pool.map(convert, jobs, [settings] * len(jobs)))
+
+    from json_metrics import write_summary
+
+    failed = [result for result in results if 'error' in result]
+    write_summary({
+        'seconds': round(time.perf_counter() - started, 3),
+        'files': len(inputs),
+        'jobs': pool_size,
+        'rows': sum(result.get('rows', 0) for result in results),
+        'failed': len(failed),
+        'runs': results,
+    }, args.summary)
+    for result in failed:
+        print(f"json-converter: {result['input']}: {result['error']}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,502 @@
+#Field extraction for posting_instruction_batch records, shared by the converter scripts
+import datetime
+import os
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from json_columns import IntColumn, typed_column, take_rows
+from json_metrics import stage
+from json_spec import load_spec, compile_path, parse_path
+
+# The output columns and their order are declared in columns.json as path expressions (see json_spec.py).
+# Each becomes a (source, key) pair:
+#   'record'      - top level of the record (e.g. timestamp)
+#   'batch'       - posting_instruction_batch
+#   'instruction' - posting_instruction_batch.posting_instructions[0]
+#   'posting'     - committed_postings[0], falling back to custom_instruction.postings[0]
+#                   when committed_postings is missing/empty or lacks the key
+#   'detail'      - value of the instruction_details entry whose 'key' matches
+#   'path'        - any other path, key is the path expression
+# readable_value_date and readable_booking_date are added from value_timestamp.
+SPEC_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'columns.json')
+field_map, column_order = load_spec(SPEC_FILE)
+
+SOURCES = ('record', 'batch', 'instruction', 'posting', 'detail', 'path')
+
+# Timezone used for the readable date columns (IANA name, DST is handled)
+TIMEZONE = 'Africa/Cairo'
+# Unit of the raw timestamps: 's', 'ms', 'us', 'ns' or 'auto' to guess from each value's size
+TIMESTAMP_UNIT = 'auto'
+
+# Columns with a handful of distinct values, dictionary-encoded as they are extracted (see DictColumn)
+CATEGORY_COLUMNS = ('denomination', 'asset', 'phase', 'account_type', 'account_address',
+                    'internal_account_processing_label')
+# Columns held in typed numpy buffers once extracted (see json_columns.py), a column whose
+# values don't fit its kind in some chunk stays a list there
+TYPED_COLUMNS = {
+    'value_timestamp': 'int64',
+    'booking_timestamp': 'int64',
+    'amount': 'decimal',  # fixed point, gives back the exact text
+    'credit': 'bool',
+}
+
+# Validation (extract_chunk(validate=True), see json_validate.py): the extractor notes records whose
+# first posting isn't where the spec expects it as (path, anomaly), only in the branches those records
+# already take, and the notes come with the rows in this extra column (None for a row without any)
+ANOMALY_COLUMN = '_anomalies'
+MISSING = 'missing'  # absent, null or empty
+WRONG_TYPE = 'wrong type'
+FALLBACK = 'fallback to custom_instruction.postings'
+RECORD_PATH = '(record)'
+_INSTRUCTIONS = 'posting_instruction_batch.posting_instructions'
+_FIRST_INSTRUCTION = _INSTRUCTIONS + '[0]'
+_EACH_INSTRUCTION = _INSTRUCTIONS + '[*]'  # exploded rows come from every instruction
+
+# factor that turns each unit into milliseconds, as (multiply, divide)
+_UNIT_TO_MS = {'s': (1000, 1), 'ms': (1, 1), 'us': (1, 1000), 'ns': (1, 1000000)}
+
+
+def _epoch_int(value):
+    """int(value) for an epoch number or integer text, 0 (missing) for anything else"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return 0
+    return value if -2 ** 63 <= value < 2 ** 63 else 0
+
+
+def timestamps_to_ms(values, unit=TIMESTAMP_UNIT):
+    """Convert epoch timestamps to int64 milliseconds, returns (ms array, missing mask)
+
+    None and 0 count as missing, and so does a value that isn't an epoch number or integer
+    text (like timestamp_ms). With unit='auto' each value is classed by magnitude:
+    below 1e11 seconds, below 1e14 milliseconds, below 1e17 microseconds, else nanoseconds.
+    """
+    if isinstance(values, IntColumn):
+        ints = values.values
+        missing = values.missing | (ints == 0)
+    else:
+        raw = np.array(values, dtype=object)
+        missing = np.equal(raw, None)
+        raw[missing] = 0
+        try:
+            ints = raw.astype(np.int64)
+        except (TypeError, ValueError, OverflowError):  # 'soon', a dict, ... somewhere in the column
+            ints = np.array([_epoch_int(value) for value in raw.tolist()], dtype=np.int64)
+        missing |= ints == 0
+    if unit == 'auto':
+        size = np.abs(ints)
+        ms = np.select([size < 10**11, size < 10**14, size < 10**17],
+                       [ints * 1000, ints, ints // 1000], ints // 1000000)
+    elif unit in _UNIT_TO_MS:
+        multiply, divide = _UNIT_TO_MS[unit]
+        ms = ints * multiply // divide
+    else:
+        raise ValueError(f"Unknown timestamp unit {unit!r}, expected one of 'auto', 's', 'ms', 'us', 'ns'")
+    return ms, missing
+
+
+def timestamp_ms(value, unit=TIMESTAMP_UNIT):
+    """timestamps_to_ms for a single value, None when it is missing (None or 0) or not a number
+
+    Like timestamps_to_ms it takes integer text too, '1720000000000'.
+    """
+    if isinstance(value, str):
+        try:
+            value = int(value)
+        except ValueError:
+            return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not value:
+        return None
+    value = int(value)
+    if unit == 'auto':
+        size = abs(value)
+        unit = 's' if size < 10**11 else 'ms' if size < 10**14 else 'us' if size < 10**17 else 'ns'
+    elif unit not in _UNIT_TO_MS:
+        raise ValueError(f"Unknown timestamp unit {unit!r}, expected one of 'auto', 's', 'ms', 'us', 'ns'")
+    multiply, divide = _UNIT_TO_MS[unit]
+    return value * multiply // divide
+
+
+def format_timestamps(values, tz=TIMEZONE, unit=TIMESTAMP_UNIT):
+    """Format epoch timestamps as 'YYYY-MM-DD HH:MM:SS.mmm +HHMM' strings in bulk, None where missing"""
+    ms, missing = timestamps_to_ms(values, unit)
+    if len(ms) == 0:
+        return []
+    zone = ZoneInfo(tz) if isinstance(tz, str) else tz
+
+    # the UTC offset only changes on whole minutes, so look it up once per distinct minute
+    minutes, index = np.unique(ms // 60000, return_inverse=True)
+    offsets = np.array([
+        datetime.datetime.fromtimestamp(int(m) * 60, tz=zone).utcoffset() // datetime.timedelta(minutes=1)
+        for m in minutes
+    ], dtype=np.int64)
+    row_offsets = offsets[index]
+    local = (ms + row_offsets * 60000).astype('datetime64[ms]')
+    text = np.char.replace(np.datetime_as_string(local, unit='ms'), 'T', ' ')
+
+    labels = {offset: ' %s%02d%02d' % ('-' if offset < 0 else '+', abs(offset) // 60, abs(offset) % 60)
+              for offset in np.unique(offsets).tolist()}
+    suffix = np.array([labels[offset] for offset in offsets.tolist()])[index]
+    result = np.char.add(text, suffix).astype(object)
+    result[missing] = None
+    return result.tolist()
+
+
+def _first_dict(items):
+    """Return items[0] if items is a non-empty list starting with a dict, else None"""
+    if items and isinstance(items, list) and isinstance(items[0], dict):
+        return items[0]
+    return None
+
+
+def _problem(value):
+    return MISSING if value is None or value == [] or value == {} else WRONG_TYPE
+
+
+def _record_problems(record):
+    """[(path, anomaly)] for a record without a first posting instruction, at the first level that is wrong"""
+    if not isinstance(record, dict):
+        return [(RECORD_PATH, _problem(record))]
+    batch = record.get('posting_instruction_batch')
+    if not isinstance(batch, dict):
+        return [('posting_instruction_batch', _problem(batch))]
+    return [(_INSTRUCTIONS, _problem(batch.get('posting_instructions')))]
+
+
+def _posting_problems(instruction, path, custom, fallback):
+    """[(path, anomaly)] for an instruction without committed postings, fallback is whether custom ones were found"""
+    committed = _problem(instruction.get('committed_postings'))
+    if fallback:
+        return [(path + '.committed_postings', FALLBACK)] + (
+            [(path + '.committed_postings', committed)] if committed == WRONG_TYPE else [])
+    problems = [(path + '.committed_postings', committed)]
+    if isinstance(custom, dict):
+        return problems + [(path + '.custom_instruction.postings', _problem(custom.get('postings')))]
+    return problems + [(path + '.custom_instruction', _problem(custom))]
+
+
+def compile_extractor(mapping):
+    """Compile a field mapping into a function that extracts all columns in one pass per record
+
+    The returned function takes an iterable of records and returns a dict of column name -> list,
+    walking posting_instructions[0] and its postings only once per record. Given a list as
+    anomalies, it adds (row, [(path, anomaly)]) for the records that are malformed.
+    """
+    for column, (source, key) in mapping.items():
+        if source not in SOURCES:
+            raise ValueError(f"Unknown source {source!r} for column {column!r}")
+    columns_by_source = {source: [(column, key) for column, (s, key) in mapping.items() if s == source]
+                         for source in SOURCES}
+    need_instruction = any(columns_by_source[s] for s in ('instruction', 'posting', 'detail'))
+    accessors = {key: compile_path(key) for _, key in columns_by_source['path']}
+    posting_keys = frozenset(key for _, key in columns_by_source['posting'])
+    detail_keys = frozenset(key for _, key in columns_by_source['detail'])
+
+    def extract(records, anomalies=None):
+        columns = {column: [] for column in mapping}
+        note = (anomalies if anomalies is not None else []).append
+        # bind the list appends once so the per-record loop is just calls
+        out = {source: [(columns[column].append, key) for column, key in columns_by_source[source]]
+               for source in SOURCES}
+        record_out, batch_out = out['record'], out['batch']
+        instruction_out, posting_out, detail_out = out['instruction'], out['posting'], out['detail']
+        missing_out = instruction_out + posting_out + detail_out
+        path_out = [(append, accessors[key]) for append, key in out['path']]
+
+        for row, raw in enumerate(records):
+            for append, get in path_out:
+                append(get(raw))
+            record = raw if isinstance(raw, dict) else {}
+            for append, key in record_out:
+                append(record.get(key))
+
+            batch = record.get('posting_instruction_batch')
+            if not isinstance(batch, dict):
+                batch = {}
+            for append, key in batch_out:
+                append(batch.get(key))
+
+            instruction = _first_dict(batch.get('posting_instructions')) if need_instruction else None
+            if instruction is None:
+                for append, _ in missing_out:
+                    append(None)
+                if need_instruction:
+                    note((row, _record_problems(raw)))
+                continue
+
+            for append, key in instruction_out:
+                append(instruction.get(key))
+
+            if posting_out:
+                committed = _first_dict(instruction.get('committed_postings'))
+                if committed is not None and posting_keys <= committed.keys():
+                    # usual case, every field is on the first committed posting
+                    for append, key in posting_out:
+                        append(committed[key])
+                else:
+                    custom = instruction.get('custom_instruction')
+                    # some entries have no value for custom_instruction as some entries are null
+                    fallback = _first_dict(custom.get('postings')) if isinstance(custom, dict) else None
+                    if committed is None:
+                        note((row, _posting_problems(instruction, _FIRST_INSTRUCTION, custom, fallback is not None)))
+                        committed = {}
+                    elif fallback is not None:
+                        taken = [key for key in posting_keys - committed.keys() if key in fallback]
+                        if taken:
+                            note((row, [(f'{_FIRST_INSTRUCTION}.committed_postings[0].{key}', FALLBACK)
+                                        for key in sorted(taken)]))
+                    if fallback is None:
+                        fallback = {}
+                    for append, key in posting_out:
+                        append(committed[key] if key in committed else fallback.get(key))
+
+            if detail_out:
+                found = _find_details(instruction, detail_keys)
+                for append, key in detail_out:
+                    append(found.get(key))
+        return columns
+
+    return extract
+
+
+def compile_exploder(mapping):
+    """Compile a field mapping for exploded output: one row per (batch, instruction, posting)
+
+    Every posting instruction is used, not just the first, and every posting of it -
+    committed_postings, or custom_instruction.postings when there are no committed ones.
+    An instruction without postings, or a batch without instructions, still gets one row.
+    The returned function gives (record_columns, row_columns, row_record): 'record',
+    'batch' and 'path' columns with one value per record, the other columns with one value per output
+    row, and the record index of each output row for repeating the per-record values. Given a
+    list as anomalies, it adds (row, [(path, anomaly)]) for the malformed records and
+    instructions, row being the first output row they give.
+    """
+    for column, (source, key) in mapping.items():
+        if source not in SOURCES:
+            raise ValueError(f"Unknown source {source!r} for column {column!r}")
+    record_level = [(column, source, key) for column, (source, key) in mapping.items()
+                    if source in ('record', 'batch', 'path')]
+    row_level = [(column, source, key) for column, (source, key) in mapping.items()
+                 if source not in ('record', 'batch', 'path')]
+    accessors = {key: compile_path(key) for _, source, key in record_level if source == 'path'}
+    detail_keys = frozenset(key for _, source, key in row_level if source == 'detail')
+
+    def extract(records, anomalies=None):
+        record_columns = {column: [] for column, _, _ in record_level}
+        row_columns = {column: [] for column, _, _ in row_level}
+        record_out = [(record_columns[column].append, source, key) for column, source, key in record_level]
+        instruction_out = [(row_columns[column], source, key) for column, source, key in row_level
+                           if source != 'posting']
+        posting_out = [(row_columns[column], key) for column, source, key in row_level if source == 'posting']
+        row_record = []
+        note = (anomalies if anomalies is not None else []).append
+
+        for record_idx, raw in enumerate(records):
+            record = raw if isinstance(raw, dict) else {}
+            batch = record.get('posting_instruction_batch')
+            if not isinstance(batch, dict):
+                batch = {}
+            for append, source, key in record_out:
+                if source == 'path':
+                    append(accessors[key](record))
+                else:
+                    append((record if source == 'record' else batch).get(key))
+
+            instructions = batch.get('posting_instructions')
+            instructions = [i for i in instructions if isinstance(i, dict)] if isinstance(instructions, list) else []
+            if not instructions:
+                note((len(row_record), _record_problems(raw)))
+            for instruction in instructions or [{}]:
+                postings = instruction.get('committed_postings')
+                if not postings or not isinstance(postings, list):
+                    custom = instruction.get('custom_instruction')
+                    postings = custom.get('postings') if isinstance(custom, dict) else None
+                    postings = [p for p in postings if isinstance(p, dict)] if isinstance(postings, list) else []
+                    if instructions:
+                        note((len(row_record), _posting_problems(instruction, _EACH_INSTRUCTION, custom,
+                                                                 bool(postings))))
+                else:
+                    postings = [p for p in postings if isinstance(p, dict)]
+                if not postings:
+                    postings = [{}]
+                count = len(postings)
+
+                # instruction values are the same for each of its postings
+                found = _find_details(instruction, detail_keys) if detail_keys else None
+                for values, source, key in instruction_out:
+                    value = instruction.get(key) if source == 'instruction' else found.get(key)
+                    values.extend([value] * count)
+                for values, key in posting_out:
+                    values.extend([posting.get(key) for posting in postings])
+                row_record.extend([record_idx] * count)
+
+        return record_columns, row_columns, row_record
+
+    return extract
+
+
+def _find_details(instruction, keys):
+    """Return {key: value} from the instruction_details entries whose 'key' is in keys, first match wins"""
+    found = {}
+    details = instruction.get('instruction_details')
+    if details and isinstance(details, list):
+        for detail in details:
+            if isinstance(detail, dict):
+                detail_key = detail.get('key')
+                if detail_key in keys and detail_key not in found:
+                    found[detail_key] = detail.get('value')
+    return found
+
+
+def repeat_rows(values_by_column, index):
+    """Pick values[i] for every i in index, for each column (columns sharing a list stay shared)"""
+    picked = {}
+    result = {}
+    for column, values in values_by_column.items():
+        key = id(values)
+        if key not in picked:
+            picked[key] = take_rows(values, index)
+        result[column] = picked[key]
+    return result
+
+
+# the keys each source is read from, lists in between are looked into item by item
+_SOURCE_KEYS = {
+    'record': [()],
+    'batch': [('posting_instruction_batch',)],
+    'instruction': [('posting_instruction_batch', 'posting_instructions')],
+    'posting': [('posting_instruction_batch', 'posting_instructions', 'committed_postings'),
+                ('posting_instruction_batch', 'posting_instructions', 'custom_instruction', 'postings')],
+}
+_DETAILS = ('posting_instruction_batch', 'posting_instructions', 'instruction_details')
+
+
+def record_fields(mapping):
+    """The parts of a record a field mapping reads, as nested dicts of keys with True for a whole value
+
+    On-demand parsing (json_reader.pick_parser) uses it to skip everything else. A list
+    has no level of its own, the same dict applies to each of its items.
+    """
+    fields = {}
+
+    def add(keys):
+        node = fields
+        for key in keys[:-1]:
+            node = node.setdefault(key, {})
+            if node is True:
+                return  # already taken whole
+        if keys:
+            node[keys[-1]] = True
+
+    for source, key in mapping.values():
+        if source == 'path':
+            for steps in parse_path(key):
+                keys = []
+                for kind, *args in steps:
+                    if kind == 'key':
+                        keys.append(args[0])
+                    elif kind == 'match':
+                        add(keys + [args[0]])
+                add(keys)
+        elif source == 'detail':
+            add(_DETAILS + ('key',))
+            add(_DETAILS + ('value',))
+        else:
+            for base in _SOURCE_KEYS[source]:
+                add(base + (key,))
+    return fields
+
+
+_extract = compile_extractor(field_map)
+_explode = compile_exploder(field_map)
+RECORD_FIELDS = record_fields(field_map)
+
+
+class DictColumn(list):
+    """A dictionary-encoded column: a plain list whose equal values are all the same object,
+    plus codes (int32 array) pointing into dictionary (the distinct values, None included)
+
+    To everything else it is just a list, so slicing or picking rows gives an ordinary list.
+    Sinks that know about it use the codes (Arrow dictionary arrays) or the dictionary
+    (column widths) instead of looking at every row.
+    """
+    __slots__ = ('codes', 'dictionary')
+
+
+def dictionary_encode(values):
+    """Return values as a DictColumn, or unchanged when they can't be hashed (lists, dicts)"""
+    lookup = {}
+    try:
+        codes = [lookup.setdefault(value, len(lookup)) for value in values]
+    except TypeError:
+        return values
+    dictionary = list(lookup)
+    column = DictColumn(map(dictionary.__getitem__, codes))
+    column.codes = np.array(codes, dtype=np.int32)
+    column.dictionary = dictionary
+    return column
+
+
+def encode_categories(columns, names=CATEGORY_COLUMNS):
+    """Dictionary-encode the low-cardinality columns of a dict of columns, in place"""
+    for name in names:
+        if name in columns and not isinstance(columns[name], DictColumn):
+            columns[name] = dictionary_encode(columns[name])
+    return columns
+
+
+def encode_typed(columns, kinds=TYPED_COLUMNS):
+    """Move the TYPED_COLUMNS of a dict of columns into typed buffers, in place"""
+    for name, kind in kinds.items():
+        if name in columns:
+            columns[name] = typed_column(columns[name], kind)
+    return columns
+
+
+def anomaly_column(anomalies, rows):
+    """The ANOMALY_COLUMN for rows rows from an extractor's (row, [(path, anomaly)]) notes"""
+    column = [None] * rows
+    for row, problems in anomalies:
+        column[row] = (column[row] or ()) + tuple(problems)
+    return column
+
+
+def extract_chunk(records, tz=TIMEZONE, unit=TIMESTAMP_UNIT, explode=False, query=None, validate=False):
+    """Extract the output columns from an iterable of raw records into one list per column
+
+    explode=True gives one row per posting of every instruction instead of one row per record.
+    The CATEGORY_COLUMNS come back dictionary-encoded, as DictColumns, and the
+    TYPED_COLUMNS as typed columns (json_columns.py). query (a json_query.Query) skips the
+    records and rows that fail its filters and extracts only its columns. validate=True adds
+    the ANOMALY_COLUMN with the structural anomalies of each row (json_validate.py).
+    """
+    with stage('extract'):
+        if query is not None:
+            records = query.filter_records(records, explode)
+        anomalies = [] if validate else None
+        if explode:
+            columns, row_columns, row_record = (_explode if query is None else query.explode)(records, anomalies)
+            if validate:
+                row_columns[ANOMALY_COLUMN] = anomaly_column(anomalies, len(row_record))
+        else:
+            columns = (_extract if query is None else query.extract)(records, anomalies)
+            if validate:
+                columns[ANOMALY_COLUMN] = anomaly_column(anomalies, len(next(iter(columns.values()), ())))
+        encode_typed(columns)  # the dates below are then formatted straight from the int64 timestamps
+        # both readable columns come from the same timestamp, so format it once and share it
+        if 'value_timestamp' in columns and (query is None or query.dates):
+            with stage('timestamp_format'):
+                readable = format_timestamps(columns['value_timestamp'], tz, unit)
+            columns['readable_value_date'] = readable
+            columns['readable_booking_date'] = readable
+        if explode:
+            # per-record values (and their formatted dates) are repeated onto each posting row
+            columns = repeat_rows(columns, row_record)
+            columns.update(row_columns)
+        if query is not None:
+            columns = query.finish(columns, explode)
+        encode_categories(columns)
+        encode_typed(columns)
+    return columns
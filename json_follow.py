@@ -0,0 +1,184 @@
+#Follow mode: keep reading an NDJSON file that is being appended to, adding new batches to the outputs as they arrive
+#
+# The file is polled for growth, only complete lines are read and the position is checkpointed
+# in the store after every micro-batch, so a restart carries on where it stopped.
+import os
+import sys
+import time
+from contextlib import ExitStack
+
+from json_compression import detect_compression
+from json_extract import extract_chunk, column_order, RECORD_FIELDS
+from json_metrics import stage, progress
+from json_reader import detect_format, pick_parser, JSON_PARSER
+from json_sinks import open_sink, sink_format, APPENDABLE
+from json_store import SqliteSink, STORE_FILE, resume_offset
+
+POLL_SECONDS = 0.5  # how often the file is checked for new data while it isn't growing
+MAX_LATENCY_SECONDS = 2  # new records are written at the latest this long after they were read
+BATCH_RECORDS = 50000  # or as soon as this many are waiting
+READ_BYTES = 16 << 20  # bytes read from the file at a time while catching up (16 MiB)
+ROLL_SECONDS = 3600  # workbooks, Parquet and Arrow outputs can't be appended to, a new file starts this often
+
+
+class RollingSink:
+    """Writes an output that can't be appended to as a series of files, a new one every roll_seconds
+
+    'transactions.xlsx' becomes transactions_20250101-120000.xlsx, transactions_20250101-130000.xlsx, ...
+    named by the time each file was started. A file can only be opened once it is finished.
+    """
+
+    def __init__(self, path, columns, roll_seconds=ROLL_SECONDS, **options):
+        self.stem, self.ext = os.path.splitext(path)
+        self.columns = columns
+        self.roll_seconds = roll_seconds
+        self.options = options
+        self.sink = None
+        self.opened = None
+        self.paths = []
+        self.rows = 0
+
+    def write(self, chunk):
+        if self.sink is None:
+            path = f"{self.stem}_{time.strftime('%Y%m%d-%H%M%S')}{self.ext}"
+            self.sink = open_sink(path, self.columns, **self.options)
+            self.opened = time.monotonic()
+            self.paths.append(path)
+        rows = self.sink.rows
+        self.sink.write(chunk)
+        self.rows += self.sink.rows - rows
+
+    def roll_if_due(self):
+        """Finish the current file once it is roll_seconds old, the next write starts a new one"""
+        if self.sink is not None and time.monotonic() - self.opened >= self.roll_seconds:
+            self.close()
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_lines(f, offset, size, limit=READ_BYTES):
+    """Read the complete lines between offset and size, returns (lines, offset after the last one)
+
+    A last line without its newline yet is left for the next read.
+    """
+    f.seek(offset)
+    data = f.read(min(size - offset, limit))
+    while b'\n' not in data and offset + len(data) < size:  # a line longer than limit
+        data += f.read(limit)
+    end = data.rfind(b'\n') + 1
+    return data[:end].splitlines(), offset + end
+
+
+def follow(path, output_files, explode=False, idle_exit=None, poll_seconds=POLL_SECONDS,
+           max_latency=MAX_LATENCY_SECONDS, roll_seconds=ROLL_SECONDS, **excel_options):
+    """Tail the NDJSON file path and append its new batches to the outputs until Ctrl+C
+
+    The store (the .db in output_files, else STORE_FILE) gets every micro-batch committed
+    together with the byte offset reached, CSV and NDJSON outputs are appended to and
+    flushed, other outputs roll over to a new file every roll_seconds. Batches the store
+    had before are skipped, and a truncated or replaced file is read again from the start
+    skipping every batch stored so far. idle_exit stops after that many seconds without new data. Returns the details
+    for the run summary.
+    """
+    if detect_compression(path):
+        raise ValueError(f"Can't follow compressed file {path}")
+    if detect_format(path) == 'array':
+        raise ValueError(f"Can only follow NDJSON (one record per line), {path} is a JSON array")
+    store_path = next((out for out in output_files if sink_format(out) == 'sqlite'), STORE_FILE)
+    appended = [out for out in output_files if sink_format(out) in APPENDABLE]
+    rolled = [out for out in output_files if out != store_path and out not in appended]
+    _, loads = pick_parser(JSON_PARSER, RECORD_FIELDS)
+    start = offset = resume_offset(store_path, path) or 0
+    bad_lines = 0
+
+    with ExitStack() as stack:
+        store = stack.enter_context(SqliteSink(store_path, column_order, replace=False))
+        appended_sinks = [stack.enter_context(APPENDABLE[sink_format(out)](out, column_order, append=True))
+                          for out in appended]
+        rolled_sinks = [stack.enter_context(RollingSink(out, column_order, roll_seconds, **excel_options))
+                        for out in rolled]
+        sinks = list(zip([store_path] + appended + rolled, [store] + appended_sinks + rolled_sinks))
+
+        def flush(records):
+            skipped = store.skipped
+            chunk = extract_chunk(records, explode=explode)
+            with stage('dedupe'):
+                chunk = store.drop_known_batches(chunk)
+            rows = len(chunk['batch_id'])
+            if rows:
+                for out, sink in sinks:
+                    with stage('write:' + sink_format(out)):
+                        sink.write(chunk)
+                for sink in appended_sinks:
+                    sink.flush()
+            store.save_checkpoint(path, offset)
+            store.commit()
+            progress(rows)
+            print(f"{time.strftime('%H:%M:%S')} {path} up to byte {offset}: {rows} new rows, "
+                  f"{store.skipped - skipped} already stored", file=sys.stderr, flush=True)
+
+        pending = []
+        pending_since = None
+        last_data = time.monotonic()
+        try:
+            while True:
+                size = os.path.getsize(path)
+                if size < offset:  # truncated or replaced, stored batches are skipped while reading it again
+                    offset = 0
+                    store.mark_stored()
+                lines = []
+                if size > offset:
+                    with open(path, 'rb') as f:  # opened per read, so a replaced file is picked up
+                        lines, offset = read_lines(f, offset, size)
+                    for line in lines:
+                        if not line.strip():
+                            continue
+                        try:
+                            pending.append(loads(line))
+                        except ValueError as e:
+                            bad_lines += 1
+                            print(f"Skipping bad line before byte {offset} of {path}: {e}", file=sys.stderr)
+                    if pending and pending_since is None:
+                        pending_since = time.monotonic()
+                if lines:
+                    last_data = time.monotonic()
+                now = time.monotonic()
+                if pending and (len(pending) >= BATCH_RECORDS or now - pending_since >= max_latency):
+                    flush(pending)
+                    pending, pending_since = [], None
+                for sink in rolled_sinks:
+                    sink.roll_if_due()
+                if lines and offset < size:
+                    continue  # still catching up
+                if idle_exit is not None and now - last_data >= idle_exit:
+                    break
+                time.sleep(poll_seconds if not pending else min(poll_seconds, max_latency))
+        except KeyboardInterrupt:
+            pass
+        if pending:
+            flush(pending)
+
+    return {
+        'mode': 'follow',
+        'input': path,
+        'started_at_byte': start,
+        'stopped_at_byte': offset,
+        'new_rows': store.rows,
+        'skipped_rows': store.skipped,
+        'bad_lines': bad_lines,
+        'latest_value_timestamp': store.last_timestamp,
+        'outputs': [{'path': store_path, 'format': 'sqlite', 'rows': store.rows}]
+                   + [{'path': out, 'format': sink_format(out), 'rows': sink.rows}
+                      for out, sink in zip(appended, appended_sinks)]
+                   + [{'path': out, 'format': sink_format(out), 'rows': sink.rows, 'files': sink.paths}
+                      for out, sink in zip(rolled, rolled_sinks)],
+    }
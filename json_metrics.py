@@ -0,0 +1,209 @@
+#Run instrumentation: time and memory per stage, progress while streaming and a JSON summary of the run
+#
+# Stages are marked in the other modules with stage('name') around a piece of work, or
+# timed(iterator, 'name') around a stream (only the time spent producing its items counts),
+# and progress(rows) counts finished rows. They do nothing unless a RunStats is active,
+# so they cost nothing in normal use.
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+PROGRESS_SECONDS = 5  # how often progress is printed to stderr while streaming, None for never
+PROFILE_FILE = 'run_profile.prof'  # cProfile output, open with `python -m pstats run_profile.prof` or snakeviz
+TOP_ENTRIES = 15  # slowest functions / biggest allocation sites listed in the summary
+PROFILES = (None, 'cprofile', 'tracemalloc')
+
+_active = None
+_END = object()
+
+
+def _rss_bytes():
+    """Current resident memory of this process, None where /proc isn't available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # bytes on macOS, KiB elsewhere
+
+
+def _mb(size):
+    return None if size is None else round(size / (1 << 20), 1)
+
+
+class RunStats:
+    """Collects the stage timings, memory and row count of one run: `with RunStats() as stats: ...`
+
+    Stage times are exclusive, time spent in a stage nested inside another one only
+    counts for the inner stage, so the stages add up to the run time. profile='cprofile'
+    profiles every function call (a lot slower), profile='tracemalloc' traces allocations.
+    """
+
+    def __init__(self, profile=None, progress_seconds=PROGRESS_SECONDS):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile {profile!r}, use one of {PROFILES}")
+        self.profile = profile
+        self.progress_seconds = progress_seconds
+        self.seconds = {}  # stage -> exclusive seconds, in the order the stages first ran
+        self.rss = {}  # stage -> highest resident memory seen when it finished
+        self.rows = 0
+        self.elapsed = None
+        self._stack = []  # seconds spent in nested stages, one entry per running stage
+
+    def __enter__(self):
+        global _active
+        self.started_at = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        if self.profile == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == 'tracemalloc':
+            tracemalloc.start()
+        self.started = self._reported = time.perf_counter()
+        self._reported_rows = 0
+        _active = self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = None
+        self.elapsed = time.perf_counter() - self.started
+        if self.profile == 'cprofile':
+            self._profiler.disable()
+            self._profiler.dump_stats(PROFILE_FILE)
+        elif self.profile == 'tracemalloc':
+            self._traced = tracemalloc.get_traced_memory()
+            self._snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+    def _finish(self, name, own, elapsed):
+        self.seconds[name] = self.seconds.get(name, 0.0) + own
+        if self._stack:
+            self._stack[-1] += elapsed  # the enclosing stage doesn't count this time as its own
+
+    @contextmanager
+    def stage(self, name):
+        """Time the body as stage name, don't yield from a generator inside it"""
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._finish(name, elapsed - self._stack.pop(), elapsed)
+            rss = _rss_bytes()
+            if rss is not None and rss > self.rss.get(name, 0):
+                self.rss[name] = rss
+
+    def timed(self, iterable, name):
+        """Yield the items of iterable, counting the time spent producing them as stage name"""
+        stack = self._stack
+        clock = time.perf_counter
+        items = iter(iterable)
+        while True:
+            stack.append(0.0)
+            start = clock()
+            try:
+                item = next(items, _END)
+            finally:
+                elapsed = clock() - start
+                self._finish(name, elapsed - stack.pop(), elapsed)
+            if item is _END:
+                return
+            yield item
+
+    def progress(self, rows):
+        """Count rows as done, printing rows/s to stderr every progress_seconds"""
+        self.rows += rows
+        now = time.perf_counter()
+        if self.progress_seconds is None or now - self._reported < self.progress_seconds:
+            return
+        rate = (self.rows - self._reported_rows) / (now - self._reported)
+        memory = _mb(_rss_bytes())
+        print(f"{self.rows:,} rows, {rate:,.0f} rows/s" + (f", {memory:,.0f} MB" if memory else ""),
+              file=sys.stderr, flush=True)
+        self._reported, self._reported_rows = now, self.rows
+
+    def _profile_summary(self):
+        if self.profile == 'cprofile':
+            stats = pstats.Stats(self._profiler)
+            top = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_ENTRIES]
+            return {'file': PROFILE_FILE, 'top_own_time': [
+                {'function': f'{path}:{line}({function})', 'calls': calls, 'own_seconds': round(own, 3),
+                 'total_seconds': round(total, 3)}
+                for (path, line, function), (_, calls, own, total, _) in top]}
+        current, peak = self._traced
+        return {'current_mb': _mb(current), 'peak_mb': _mb(peak), 'top_allocations': [
+            {'line': str(stat.traceback[0]), 'mb': _mb(stat.size), 'blocks': stat.count}
+            for stat in self._snapshot.statistics('lineno')[:TOP_ENTRIES]]}
+
+    def summary(self, **info):
+        """The run as a dict ready for json.dump, info adds run details (input, outputs, ...)"""
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        stages = {}
+        for name, seconds in self.seconds.items():
+            stages[name] = {'seconds': round(seconds, 3), 'share': round(seconds / elapsed, 3) if elapsed else 0}
+            if name in self.rss:  # timed() streams don't sample memory, it would cost too much per item
+                stages[name]['rss_mb'] = _mb(self.rss[name])
+        summary = {
+            'started': self.started_at,
+            'seconds': round(elapsed, 3),
+            'rows': self.rows,
+            'rows_per_sec': round(self.rows / elapsed) if elapsed else None,
+            'peak_rss_mb': _mb(_peak_rss_bytes()),
+            'stages': stages,
+            'unaccounted_seconds': round(elapsed - sum(self.seconds.values()), 3),
+        }
+        summary.update(info)
+        if self.profile:
+            summary[self.profile] = self._profile_summary()
+        return summary
+
+
+def stage(name):
+    """Time a block as stage name of the active run, does nothing when no run is active"""
+    return _active.stage(name) if _active is not None else nullcontext()
+
+
+def timed(iterable, name):
+    """Count the time spent producing the items of iterable as stage name of the active run"""
+    return _active.timed(iterable, name) if _active is not None else iterable
+
+
+def progress(rows):
+    """Count rows as done in the active run"""
+    if _active is not None:
+        _active.progress(rows)
+
+
+def detach():
+    """Stop recording in a worker process forked during a run, it inherits the parent's run and profiler"""
+    global _active
+    _active = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    sys.setprofile(None)
+
+
+def write_summary(summary, path=None):
+    """Print the summary as JSON on stdout, and save it to path when given"""
+    text = json.dumps(summary, indent=2, default=str)
+    print(text)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
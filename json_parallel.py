@@ -0,0 +1,74 @@
+#Parallel extraction: byte ranges of the input are parsed and extracted in a process pool
+import itertools
+import os
+from collections import deque
+from multiprocessing import Pool
+
+from json_reader import split_ranges, iter_range_records
+from json_extract import extract_chunk, RECORD_FIELDS, TIMEZONE, TIMESTAMP_UNIT
+from json_metrics import detach
+
+RANGE_BYTES = 32 << 20  # input bytes handed to a worker at a time (32 MiB)
+IN_FLIGHT = 2  # ranges per worker submitted ahead of the outputs, finished ones wait in memory until written
+
+
+def _extract_range(task):
+    """Worker: parse and extract one byte range, returns (columns, None) or (None, error message)"""
+    path, kind, start, end, tz, unit, explode, query, validate = task
+    fields, prefilter = (RECORD_FIELDS, None) if query is None else (query.fields, query.prefilter)
+    try:
+        records = iter_range_records(path, kind, start, end, fields=fields, prefilter=prefilter)
+        return extract_chunk(records, tz, unit, explode, query, validate), None
+    except ValueError as e:  # json.JSONDecodeError is a ValueError
+        return None, str(e)
+
+
+def _imap_bounded(pool, func, tasks, window):
+    """pool.imap that has at most window tasks submitted and not yet taken, so a slow consumer bounds memory"""
+    tasks = iter(tasks)
+    pending = deque(pool.apply_async(func, (task,)) for task in itertools.islice(tasks, window))
+    while pending:
+        result = pending.popleft().get()
+        for task in itertools.islice(tasks, 1):  # keep the workers busy while the result is used
+            pending.append(pool.apply_async(func, (task,)))
+        yield result
+
+
+def iter_extracted_parallel(path, workers=None, range_bytes=RANGE_BYTES, tz=TIMEZONE, unit=TIMESTAMP_UNIT,
+                            explode=False, query=None, validate=False):
+    """Extract path with a pool of workers and yield a dict of columns per range, in input order
+
+    workers=None uses every CPU. The chunks come out exactly as a serial run would
+    produce them, only grouped per byte range instead of per CHUNK_SIZE records. At most
+    IN_FLIGHT ranges per worker are extracted ahead of the consumer.
+    query (json_query.Query) is applied in the workers, and so is validate (see extract_chunk).
+    """
+    kind, ranges = split_ranges(path, range_bytes)
+    if not ranges:
+        return
+    tasks = [(path, kind, start, end, tz, unit, explode, query, validate) for start, end in ranges]
+    workers = workers or os.cpu_count()
+    with Pool(workers, initializer=detach) as pool:
+        skip_until = 0
+        for idx, (columns, error) in enumerate(_imap_bounded(pool, _extract_range, tasks, IN_FLIGHT * workers)):
+            if idx < skip_until:
+                continue  # already covered by a recovered range below
+            if error is None:
+                yield columns
+                continue
+            if kind == 'ndjson':
+                raise ValueError(f"Bad record in {path} between bytes {ranges[idx][0]} and {ranges[idx][1]}: {error}")
+
+            # an array split point landed inside a string, so this range ends mid-record;
+            # widen it over the following ranges in this process until it parses cleanly
+            last = idx + 1
+            while last < len(ranges):
+                columns, error = _extract_range((path, kind, ranges[idx][0], ranges[last][1], tz, unit, explode,
+                                                 query, validate))
+                if error is None:
+                    break
+                last += 1
+            if error is not None:
+                raise ValueError(f"Bad JSON in {path} after byte {ranges[idx][0]}: {error}")
+            skip_until = last + 1
+            yield columns
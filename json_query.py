@@ -0,0 +1,224 @@
+#Query pushdown: keep only the records and columns asked for, decided while extracting instead of afterwards
+#
+#   FILTERS = [('account_id', '==', '253b780b-a59f-4595-8328-221d01d26caf'),
+#              ('phase', 'in', ['POSTING_PHASE_COMMITTED']),
+#              ('value_timestamp', '>=', '2025-04-01'), ('value_timestamp', '<', '2025-05-01')]
+#   COLUMNS = ['batch_id', 'credit', 'amount', 'account_id', 'readable_value_date']
+#
+# Filters are (column, operator, value) and must all hold. A record is tested before any of its
+# columns are extracted, reading only the fields the filters name and the cheapest first: the
+# record's own keys, then the batch, the first instruction, its posting, its instruction_details
+# and last any other path. With a fast parser the raw bytes of a record are first searched for
+# the values of '==' and 'in' filters on text, so most records that can't match are never parsed.
+# Timestamp columns compare as instants: epoch numbers (any unit, like TIMESTAMP_UNIT='auto') or
+# ISO dates and times, '2025-04-01' or '2025-04-01 12:30', taken in json_extract.TIMEZONE when
+# they have no UTC offset. Decimal columns (amount) compare as numbers, the raw text and the filter value
+# are both read as Decimal, so ('amount', '>', 100) and ('amount', '==', '12.5') match '12.50'. A missing
+# value, or one that isn't a number in a decimal column, only matches '==' None, '!=' and 'not in'.
+import datetime
+from decimal import Decimal, InvalidOperation
+import json
+import operator
+import re
+from zoneinfo import ZoneInfo
+
+from json_extract import (field_map, column_order, compile_extractor, compile_exploder, record_fields, timestamp_ms,
+                          repeat_rows, ANOMALY_COLUMN, TYPED_COLUMNS, TIMEZONE, TIMESTAMP_UNIT)
+from json_spec import compile_path, to_path
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda value, wanted: value in wanted,
+    'not in': lambda value, wanted: value not in wanted,
+}
+TIMESTAMP_COLUMNS = ('value_timestamp', 'booking_timestamp')
+DATE_COLUMNS = ('readable_value_date', 'readable_booking_date')  # both formatted from value_timestamp
+DECIMAL_COLUMNS = tuple(column for column, kind in TYPED_COLUMNS.items() if kind == 'decimal')
+
+# reading a field gets dearer the deeper it sits, filters are tested in this order
+SOURCE_COST = {'record': 0, 'batch': 1, 'instruction': 2, 'posting': 3, 'detail': 4, 'path': 5}
+# sources that differ between the rows of one record when exploding
+ROW_SOURCES = ('instruction', 'posting', 'detail')
+# text that every JSON encoder writes as-is, so its quoted form has to appear in the raw bytes
+_PLAIN_TEXT = re.compile(r'[A-Za-z0-9 _.:@+-]*').fullmatch
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _instant(value, zone, unit):
+    """A filter value for a timestamp column as epoch milliseconds"""
+    if isinstance(value, str):
+        text = value.strip()
+        if not text.lstrip('-').isdigit():
+            value = datetime.datetime.fromisoformat(text)
+        else:
+            value = int(text)
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=zone)
+        return (value - _EPOCH) // datetime.timedelta(milliseconds=1)
+    return timestamp_ms(value, unit)
+
+
+def _decimal(value):
+    """An amount as a finite Decimal, None when it is missing or not a number"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = Decimal(repr(value) if isinstance(value, float) else value)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return number if number.is_finite() else None
+
+
+class Query:
+    """Row filters and a column projection for extract_chunk
+
+    filters is a list of (column, operator, value) over the extracted columns, operators
+    are the keys of OPERATORS ('in' and 'not in' take a list). columns picks and orders
+    the output columns, None keeps column_order. Only what the columns and filters use
+    is extracted, or parsed at all with pysimdjson.
+    """
+
+    def __init__(self, filters=(), columns=None, tz=TIMEZONE, unit=TIMESTAMP_UNIT):
+        self.filters = [tuple(item) for item in filters]
+        self.projection = None if columns is None else list(columns)
+        self.tz, self.unit = tz, unit
+        self.columns = list(column_order) if columns is None else list(columns)
+        unknown = [column for column in self.columns if column not in column_order]
+        if unknown:
+            raise ValueError(f"Unknown output columns {unknown}, the columns are {column_order}")
+        zone = ZoneInfo(tz) if isinstance(tz, str) else tz
+        tests = sorted((self._test(column, op, value, zone) for column, op, value in self.filters),
+                       key=lambda test: SOURCE_COST[field_map[test[0]][0]])
+
+        self.dates = any(column in DATE_COLUMNS for column in self.columns)
+        wanted = set(self.columns) | ({'value_timestamp'} if self.dates else set())
+        row_columns = {column for column, _ in tests if field_map[column][0] in ROW_SOURCES}
+        self.mapping = {column: field for column, field in field_map.items() if column in wanted}
+        # exploded rows are filtered on their own values, so those columns are extracted too
+        self.explode_mapping = {column: field for column, field in field_map.items()
+                                if column in wanted or column in row_columns}
+        self.fields = record_fields({column: field for column, field in field_map.items()
+                                     if column in wanted or any(column == test[0] for test in tests)})
+        self.extract = compile_extractor(self.mapping)
+        self.explode = compile_exploder(self.explode_mapping)
+
+        getters = [(compile_path(to_path(*field_map[column])), test) for column, test in tests]
+        self.record_checks = getters
+        self.batch_checks = [check for check, (column, _) in zip(getters, tests) if column not in row_columns]
+        self.row_tests = [(column, test) for column, test in tests if column in row_columns]
+        self.needles = [needles for needles in map(self._needles, self.filters) if needles]
+        # for iter_records, None when no filter can be checked on the raw bytes
+        self.prefilter = self._prefilter if self.needles else None
+
+    def _test(self, column, op, value, zone):
+        """(column, function of the column's value -> keep) for one filter"""
+        if column not in field_map:
+            raise ValueError(f"Can only filter on the extracted columns {list(field_map)}, not {column!r}")
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown filter operator {op!r}, use one of {list(OPERATORS)}")
+        compare = OPERATORS[op]
+        many = op in ('in', 'not in')
+        if many and (isinstance(value, str) or not hasattr(value, '__iter__')):
+            raise ValueError(f"Filter {column} {op} needs a list of values, not {value!r}")
+        timestamps = column in TIMESTAMP_COLUMNS
+        decimals = column in DECIMAL_COLUMNS
+        if timestamps:
+            value = [_instant(item, zone, self.unit) for item in value] if many else _instant(value, zone, self.unit)
+        elif decimals:
+            items = value if many else [value]
+            numbers = [_decimal(item) for item in items]
+            bad = [item for item, number in zip(items, numbers) if number is None and item is not None]
+            if bad:
+                raise ValueError(f"Filter {column} {op} needs numbers, not {bad[0]!r}")
+            value = numbers if many else numbers[0]
+        if many:
+            value = list(value)
+            if all(item is None or isinstance(item, (str, int, Decimal)) for item in value):
+                value = frozenset(value)
+        unit = self.unit
+        ordered = op not in ('==', '!=') and not many
+
+        def test(found):
+            if timestamps:
+                found = timestamp_ms(found, unit)
+            elif decimals:
+                found = _decimal(found)
+            if found is None and ordered:
+                return False
+            try:
+                return compare(found, value)
+            except TypeError:  # e.g. a number against a text value
+                return False
+        return column, test
+
+    def _needles(self, item):
+        """Quoted JSON bytes of which one has to be in a record for filter item to hold, None when unknown"""
+        column, op, value = item
+        values = [value] if op == '==' else value if op == 'in' else None
+        if column in TIMESTAMP_COLUMNS or column in DECIMAL_COLUMNS or not values:
+            return None
+        if not all(isinstance(text, str) and _PLAIN_TEXT(text) for text in values):
+            return None
+        return tuple(json.dumps(text).encode() for text in values)
+
+    def _prefilter(self, data):
+        """False when the raw bytes of a record show it can't pass the filters, before parsing them"""
+        for needles in self.needles:
+            if not any(needle in data for needle in needles):
+                return False
+        return True
+
+    def keep_record(self, record, explode=False):
+        """True when a parsed record passes the filters, exploded records only on their per-record fields"""
+        for get, test in self.batch_checks if explode else self.record_checks:
+            if not test(get(record)):
+                return False
+        return True
+
+    def filter_records(self, records, explode=False):
+        if not (self.batch_checks if explode else self.record_checks):
+            return records
+        return (record for record in records if self.keep_record(record, explode))
+
+    def finish(self, columns, explode=False):
+        """Drop the exploded rows that fail the per-row filters, and every column that isn't an output
+
+        The ANOMALY_COLUMN of a validating run stays, it goes with the rows to json_validate.
+        """
+        if explode and self.row_tests:
+            values = [columns[column] for column, _ in self.row_tests]
+            tests = [test for _, test in self.row_tests]
+            keep = [idx for idx, row in enumerate(zip(*values)) if all(map(_call, tests, row))]
+            if len(keep) < len(values[0]):
+                columns = repeat_rows(columns, keep)
+        projected = {column: columns[column] for column in self.columns}
+        if ANOMALY_COLUMN in columns:
+            projected[ANOMALY_COLUMN] = columns[ANOMALY_COLUMN]
+        return projected
+
+    def describe(self):
+        """The query for run summaries and cache keys"""
+        return {'filters': [list(item) for item in self.filters], 'columns': self.projection}
+
+    def __reduce__(self):
+        # the compiled functions can't be pickled, a worker process builds them again
+        return Query, (self.filters, self.projection, self.tz, self.unit)
+
+
+def _call(test, value):
+    return test(value)
+
+
+def make_query(filters=(), columns=None, tz=TIMEZONE, unit=TIMESTAMP_UNIT):
+    """A Query, or None when there is nothing to filter or project (the full extraction is used)"""
+    if not filters and columns is None:
+        return None
+    return Query(filters, columns, tz, unit)
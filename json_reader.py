@@ -0,0 +1,450 @@
+#Streaming reader for out.json so the whole file never has to sit in memory
+import contextlib
+import importlib
+import io
+import itertools
+import json
+import mmap
+import os
+import re
+
+import numpy as np
+
+from json_compression import detect_compression, open_decompressed
+
+READ_SIZE = 1 << 20  # characters read from the file per refill (1 MiB)
+# 'simdjson' (pysimdjson), 'orjson', 'ujson', 'json' (stdlib) or 'auto' for the fastest one installed
+JSON_PARSER = 'auto'
+USE_MMAP = True  # parse straight from a memory map of the input instead of reading it into buffers
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+def _skip(buf, pos, chars):
+    """Return the first position in buf at or after pos that is not in chars"""
+    end = len(buf)
+    while pos < end and buf[pos] in chars:
+        pos += 1
+    return pos
+
+
+def _iter_array(f, buf):
+    """Yield the elements of a top-level JSON array one at a time"""
+    pos = 1  # buf starts with the opening '['
+    eof = False
+    while True:
+        pos = _skip(buf, pos, _WHITESPACE + ',')
+        if pos >= len(buf):
+            if eof:
+                raise ValueError('Unexpected end of file inside the top-level array')
+            more = f.read(READ_SIZE)
+            eof = not more
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            record, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # most likely the record runs past the end of the buffer, so read more and retry
+            if eof:
+                raise
+            more = f.read(READ_SIZE)
+            eof = not more
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+        yield record
+        pos = end
+
+
+def _iter_lines(f, first):
+    """Yield one record per non-blank line (NDJSON)"""
+    line = first + f.readline()
+    while line:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+        line = f.readline()
+
+
+def _simdjson_loads(simdjson, fields):
+    """loads for pysimdjson, turning only the parts of the record named in fields into Python objects"""
+    parser = simdjson.Parser()
+    if fields is None:
+        return lambda data: parser.parse(data, recursive=True)
+    Object, Array = simdjson.Object, simdjson.Array
+
+    def prune(value, fields):
+        if isinstance(value, Object):
+            if fields is True:
+                return value.as_dict()
+            return {key: prune(value[key], sub) for key, sub in fields.items() if key in value}
+        if isinstance(value, Array):
+            if fields is True:
+                return value.as_list()
+            return [prune(item, fields) for item in value]
+        return value
+
+    def loads(data):
+        # the parsed document has to be gone before the parser is used again, so only the copy leaves here
+        try:
+            document = parser.parse(data)
+        except RuntimeError as e:  # invalid JSON
+            raise ValueError(str(e)) from e
+        return prune(document, fields)
+
+    return loads
+
+
+def pick_parser(name=JSON_PARSER, fields=None):
+    """Return (name, loads), loads turning the bytes of one record into Python objects
+
+    fields is a nested dict of the keys that are used (see json_extract.record_fields), True
+    meaning the whole value. With it, pysimdjson parses on demand and builds only those
+    parts of each record, which pays off when the columns use a small part of big records.
+    'auto' picks orjson, then pysimdjson when fields is given, ujson and finally the stdlib
+    json module (orjson was the fastest on our posting batches).
+    """
+    if name == 'auto':
+        candidates = ['orjson'] + (['simdjson'] if fields is not None else []) + ['ujson']
+    else:
+        candidates = [] if name == 'json' else [name]
+    for candidate in candidates:
+        try:
+            module = importlib.import_module(candidate)
+        except ImportError:
+            if name != 'auto':
+                raise
+            continue
+        if candidate == 'simdjson':
+            return candidate, _simdjson_loads(module, fields)
+        return candidate, module.loads
+    return 'json', json.loads
+
+
+@contextlib.contextmanager
+def map_file(path):
+    """Memory-map path read-only, gives None for an empty file (those can't be mapped)"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield None
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)  # read ahead, pages behind us can go
+            yield mm
+
+
+def _release(mm, upto):
+    """Drop the mapped pages before upto from this process, they stay in the OS page cache"""
+    upto -= upto % mmap.PAGESIZE
+    if upto and hasattr(mmap, 'MADV_DONTNEED'):
+        mm.madvise(mmap.MADV_DONTNEED, 0, upto)
+
+
+def _iter_mapped_lines(mm, start=0, end=None):
+    """Yield the non-blank lines that start in mm[start:end], as bytes"""
+    end = len(mm) if end is None else end
+    pos = start
+    released = start
+    while pos < end:
+        stop = mm.find(b'\n', pos)
+        if stop < 0:
+            stop = len(mm)
+        line = mm[pos:stop].strip()
+        if line:
+            yield line
+        pos = stop + 1
+        if pos - released > READ_SIZE * 16:
+            _release(mm, pos)
+            released = pos
+
+
+def _iter_mapped_array(mm, start):
+    """Yield the bytes of each element of the top-level array in mm, start is just after the '['"""
+    size = READ_SIZE
+    while True:
+        stop = min(start + size, len(mm))
+        spans, end = _element_spans(mm, start, stop)
+        for span_start, span_stop in spans:
+            yield mm[span_start:span_stop]
+        if end is not None:
+            return
+        if stop == len(mm):
+            raise ValueError('Unexpected end of file inside the top-level array')
+        if spans:
+            start = spans[-1][1]
+            size = READ_SIZE
+            _release(mm, start)
+        else:
+            size *= 2  # one element is bigger than the window
+
+
+def _iter_text(f):
+    """Yield records from a text stream of a JSON array or NDJSON, parsed with the stdlib json module"""
+    first = f.read(1)
+    while first and first in _WHITESPACE:
+        first = f.read(1)
+    if not first:
+        return
+    if first == '[':
+        yield from _iter_array(f, first)
+    else:
+        yield from _iter_lines(f, first)
+
+
+def _parse(pieces, loads, prefilter=None):
+    """loads() each piece of bytes, skipping those prefilter turns down without parsing them"""
+    if prefilter is not None:
+        pieces = filter(prefilter, pieces)
+    return map(loads, pieces)
+
+
+def _iter_binary(f, loads, prefilter=None):
+    """Yield records from a binary stream of a JSON array or NDJSON, parsed with loads"""
+    first = f.read(1)
+    while first and first in b' \t\n\r':
+        first = f.read(1)
+    if first == b'[':
+        yield from _parse(_iter_array_bytes(f), loads, prefilter)
+    elif first:
+        lines = filter(None, map(bytes.strip, itertools.chain([first + f.readline()], f)))
+        yield from _parse(lines, loads, prefilter)
+
+
+def iter_records(path, parser=JSON_PARSER, fields=None, prefilter=None):
+    """Yield records from a JSON array file or an NDJSON file (one record per line)
+
+    parser and fields choose the JSON parser, see pick_parser. prefilter, a function of the
+    raw bytes of a record, can turn records down before they are parsed (see json_query.py),
+    it is used with the fast parsers, which are given bytes. The fast parsers take bytes,
+    with USE_MMAP they parse straight from a memory map of the file, so nothing is decoded
+    or copied besides each record and repeated runs are served from the OS page cache.
+    The stdlib json module works on str and reads the file as text, 1 MiB at a time.
+    gzip, bz2 and zstd files are decompressed in a background thread as they are parsed.
+    """
+    name, loads = pick_parser(parser, fields)
+    if detect_compression(path):
+        with open_decompressed(path) as f:
+            if name == 'json':
+                yield from _iter_text(io.TextIOWrapper(f, encoding='utf-8'))
+            else:
+                yield from _iter_binary(f, loads, prefilter)
+        return
+
+    if name != 'json' and USE_MMAP:
+        with map_file(path) as mm:
+            if mm is None:
+                return
+            kind = detect_format(path)
+            if kind == 'ndjson':
+                yield from _parse(_iter_mapped_lines(mm), loads, prefilter)
+            elif kind == 'array':
+                yield from _parse(_iter_mapped_array(mm, first_record_offset(path, kind)), loads, prefilter)
+        return
+
+    if name != 'json':
+        with open(path, 'rb') as f:
+            yield from _iter_binary(f, loads, prefilter)
+        return
+
+    with open(path, 'r') as f:
+        yield from _iter_text(f)
+
+
+_SEPARATORS = b' \t\n\r,'
+# one element that isn't an object or array (null, a number, a string) and the separators before it
+_SCALAR = re.compile(rb'[\s,]*("(?:[^"\\]|\\.)*"|[^\s,]+)')
+
+
+def _element_spans(buf, start=0, stop=None):
+    """Find the complete elements in buf[start:stop], a piece of a JSON array that starts between two elements
+
+    Returns ([(start, stop), ...], end) with positions in buf, end being the position of the
+    array's closing ']' or None when it isn't in the piece. numpy finds the quotes and brackets
+    (without copying when buf is a memory map), a bracket with an odd number of quotes before
+    it is inside a string, the others give the nesting depth. Elements that aren't objects or
+    arrays are found with a regular expression in what is left between those.
+    """
+    stop = len(buf) if stop is None else stop
+    a = np.frombuffer(buf, np.uint8, count=stop - start, offset=start)
+    quotes = np.flatnonzero(a == 34)
+    if quotes.size:
+        # a quote after an odd number of backslashes is part of the string
+        after_backslash = np.flatnonzero((quotes > 0) & (a[np.maximum(quotes - 1, 0)] == 92))
+        if after_backslash.size:
+            escaped = []
+            for idx in after_backslash.tolist():
+                pos = int(quotes[idx]) - 1
+                while pos >= 0 and a[pos] == 92:
+                    pos -= 1
+                if (quotes[idx] - pos) % 2 == 0:
+                    escaped.append(idx)
+            quotes = np.delete(quotes, escaped)
+    folded = a | 32  # '[' and ']' become '{' and '}'
+    brackets = np.flatnonzero((folded == 123) | (folded == 125))
+    brackets = brackets[(np.searchsorted(quotes, brackets) & 1) == 0]
+    steps = np.where(folded[brackets] == 123, 1, -1)
+    depth = np.cumsum(steps)
+    del a, folded  # a is a view of buf, a memory map can't be closed while one is alive
+
+    brackets += start
+    ends = brackets[depth < 0]
+    end = int(ends[0]) if ends.size else None
+    starts = brackets[(steps == 1) & (depth == 1)].tolist()
+    stops = (brackets[(steps == -1) & (depth == 0)] + 1).tolist()
+    spans = list(zip(starts, stops))
+
+    # between the objects and arrays there are commas, whitespace and any other elements
+    gaps = zip([start] + stops, starts + ([end] if end is not None else []))
+    scalars = []
+    for gap_start, gap_stop in gaps:
+        gap = buf[gap_start:gap_stop]
+        if gap.strip(_SEPARATORS):
+            scalars += [(gap_start + match.start(1), gap_start + match.end(1)) for match in _SCALAR.finditer(gap)]
+    if scalars:
+        spans = sorted(spans + scalars)
+    return spans, end
+
+
+def _iter_array_bytes(f):
+    """Yield the bytes of each element of the top-level array f is positioned in (just after the '[')"""
+    buf = b''
+    while True:
+        more = f.read(max(READ_SIZE, len(buf)))  # at least double when one element is bigger than the buffer
+        buf += more
+        spans, end = _element_spans(buf)
+        for start, stop in spans:
+            yield buf[start:stop]
+        if end is not None:
+            return
+        if not more:
+            raise ValueError('Unexpected end of file inside the top-level array')
+        if spans:
+            buf = buf[spans[-1][1]:]
+
+
+def detect_format(path):
+    """Return 'array' for a top-level JSON array, 'ndjson' otherwise, None for an empty file"""
+    with open_decompressed(path) if detect_compression(path) else open(path, 'rb') as f:
+        while True:
+            block = f.read(4096)
+            if not block:
+                return None
+            block = block.lstrip()
+            if block:
+                return 'array' if block[:1] == b'[' else 'ndjson'
+
+
+# where one object ends and the next begins inside the top-level array: the '{' of '}, {'
+_BOUNDARY = re.compile(rb'\}\s*,\s*\{')
+
+
+def _find_boundary(mm, offset):
+    """Return the offset of the first '}, {' object start at or after offset in the mapped file, None if there is none"""
+    match = _BOUNDARY.search(mm, offset)
+    return match.end() - 1 if match else None
+
+
+def split_ranges(path, size):
+    """Split a file into byte ranges of roughly size bytes for parallel reading
+
+    Returns (format, [(start, end), ...]). NDJSON can be cut anywhere because
+    iter_range_records skips to the next line. For a JSON array every range starts
+    at the '{' of a '}, {' - which in rare cases is inside a string, so a range can be
+    misaligned; iter_range_records then fails on it and the caller has to recover.
+    """
+    kind = detect_format(path)
+    total = os.path.getsize(path)
+    if kind is None:
+        return kind, []
+    if kind == 'ndjson':
+        return kind, [(start, min(start + size, total)) for start in range(0, total, size)]
+
+    with map_file(path) as mm:
+        starts = [first_record_offset(path, kind)]
+        while starts[-1] + size < total:
+            start = _find_boundary(mm, starts[-1] + size)
+            if start is None:
+                break
+            starts.append(start)
+    return kind, list(zip(starts, starts[1:] + [total]))
+
+
+def first_record_offset(path, kind):
+    """Byte offset where the first record can start: 0 for NDJSON, just after the '[' of an array"""
+    if kind != 'array':
+        return 0
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+    return len(head) - len(head.lstrip()) + 1
+
+
+def end_of_records(path, kind):
+    """Byte offset just past the last complete record, where reading can pick up once more is appended
+
+    For NDJSON that is after the last newline, so a line that is still being written is
+    left for the next run. For an array it is after the last '}', before the closing ']'.
+    """
+    with map_file(path) as mm:
+        if mm is None:
+            return 0
+        return mm.rfind(b'\n' if kind == 'ndjson' else b'}') + 1
+
+
+def iter_range_records(path, kind, start, end, parser=JSON_PARSER, fields=None, prefilter=None):
+    """Yield the records of one range from split_ranges
+
+    An NDJSON range owns every line that starts inside it, its lines are parsed with
+    pick_parser(parser, fields) when prefilter (see iter_records) lets them through. An array
+    range must hold whole records only, otherwise json.JSONDecodeError is raised.
+    """
+    loads = pick_parser(parser, fields)[1]
+    if kind == 'ndjson' and USE_MMAP:
+        with map_file(path) as mm:
+            if mm is None:
+                return
+            if start > 0:
+                # the line running into this range belongs to the previous one
+                newline = mm.find(b'\n', start - 1)
+                start = len(mm) if newline < 0 else newline + 1
+            yield from _parse(_iter_mapped_lines(mm, start, end), loads, prefilter)
+        return
+
+    with open(path, 'rb') as f:
+        if kind == 'ndjson':
+            if start > 0:
+                f.seek(start - 1)
+                f.readline()  # the line running into this range belongs to the previous one
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if line and (prefilter is None or prefilter(line)):
+                    yield loads(line)
+            return
+
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+        pos = 0
+        while True:
+            pos = _skip(text, pos, _WHITESPACE + ',')
+            if pos >= len(text) or text[pos] == ']':
+                return
+            record, pos = _decoder.raw_decode(text, pos)
+            yield record
+
+
+def iter_chunks(records, size):
+    """Split records into consecutive lazy chunks of at most size records
+
+    Each chunk is an iterator over the shared record stream, so only the record being
+    extracted is held in memory. Consume a chunk fully before asking for the next one.
+    """
+    records = iter(records)
+    for first in records:
+        yield itertools.chain((first,), itertools.islice(records, size - 1))
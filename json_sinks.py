@@ -0,0 +1,693 @@
+#Output writers that take the extracted columns chunk by chunk, so rows never pile up in memory
+import csv
+import json
+import os
+import pickle
+import re
+import tempfile
+
+from json_columns import take_rows
+from json_compression import open_text_output, split_suffix
+from json_metrics import stage
+
+SHEET_NAME = 'Transactions'
+EXCEL_BACKEND = 'auto'  # 'xlsxwriter', 'openpyxl' or 'auto' (xlsxwriter when installed)
+WIDTH_SAMPLE_ROWS = None  # set to N to size columns from only the first N rows of each chunk
+MAX_COLUMN_WIDTH = 255  # Excel will not go wider than this
+MAX_SHEET_ROWS = 1048576  # Excel's row limit, including the header row
+SHARD_ROWS = MAX_SHEET_ROWS - 1  # data rows per sheet before rolling over to the next one
+SHARD_FILES = False  # roll over to new workbook files (out_2.xlsx, ...) instead of new sheets
+PARTITION_BY = None  # None, an output column such as 'account_id', or 'day' (date of the timestamp)
+AMOUNT_TYPE = 'decimal'  # how Parquet/Arrow store amount: 'decimal' (exact, 18 decimal places) or 'float'
+# True also writes summaries and reports next to the file outputs (CSV, JSON, Parquet, ...) as files of their own,
+# off by default because they'd be picked up by globs like out*.csv. Workbooks and .db stores always get them
+TABLE_FILES = False
+
+# Arrow/Parquet type per output column, anything not listed is stored as a string
+ARROW_TYPES = {
+    'credit': 'bool',
+    'amount': 'amount',
+    'denomination': 'dictionary',
+    'asset': 'dictionary',
+    'phase': 'dictionary',
+    'account_type': 'dictionary',
+    'account_address': 'dictionary',
+    'internal_account_processing_label': 'dictionary',
+    'value_timestamp': 'int64',
+    'booking_timestamp': 'int64',
+}
+
+# Same header look as pandas' to_excel: bold, thin border, centered
+HEADER_STYLE = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+
+
+def longest_text(values):
+    """Length of the longest str(value) in values
+
+    str() hands back the same object for values that are already strings, so only the
+    non-string values (numbers, bools, None) get a temporary text copy. Typed columns
+    (json_columns.py) work it out from their arrays.
+    """
+    if hasattr(values, 'longest_text'):
+        return values.longest_text()
+    if not values:
+        return 0
+    return max(map(len, map(str, values)))
+
+
+class ColumnWidths:
+    """Running max text length per column, updated chunk by chunk as rows are written
+
+    Widths follow the old autosize loop: longest str(value) or header, plus 2, capped at
+    max_width. With sample_rows set only the first sample_rows rows of each chunk are measured.
+    """
+
+    def __init__(self, columns, sample_rows=WIDTH_SAMPLE_ROWS, max_width=MAX_COLUMN_WIDTH):
+        self.longest = [len(column) for column in columns]
+        self.sample_rows = sample_rows
+        self.max_width = max_width
+
+    def update(self, values_by_column):
+        """Measure one chunk, given as a list of value lists in column order"""
+        measured = {}
+        for idx, values in enumerate(values_by_column):
+            # columns that share one list (like the two readable dates) are measured once
+            key = id(values)
+            if key not in measured:
+                if getattr(values, 'dictionary', None) is not None:
+                    values = values.dictionary  # a dictionary-encoded column, its distinct values are enough
+                elif self.sample_rows is not None:
+                    values = values[:self.sample_rows]
+                measured[key] = longest_text(values)
+            if measured[key] > self.longest[idx]:
+                self.longest[idx] = measured[key]
+
+    def widths(self):
+        """Return the final width of every column"""
+        return [min(longest + 2, self.max_width) for longest in self.longest]
+
+
+class XlsxWriterBook:
+    """One workbook written with xlsxwriter's constant_memory mode, rows go straight to disk"""
+
+    def __init__(self, path):
+        import xlsxwriter
+
+        self.workbook = xlsxwriter.Workbook(path, {
+            'constant_memory': True,
+            # write every string as-is, the data has no formulas or links
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+        })
+        self.header_format = self.workbook.add_format(HEADER_STYLE)
+
+    def add_sheet(self, name, columns):
+        sheet = self.workbook.add_worksheet(name)
+        for idx, column in enumerate(columns):
+            sheet.write_string(0, idx, column, self.header_format)
+        return [sheet, 1]  # the sheet and the next row to write
+
+    def append(self, sheet, rows):
+        worksheet, row_idx = sheet
+        write_row = worksheet.write_row
+        for row in rows:
+            write_row(row_idx, 0, row)
+            row_idx += 1
+        sheet[1] = row_idx
+
+    def finish_sheet(self, sheet, widths):
+        # column info is written when the workbook is assembled, so widths can be set last
+        for idx, width in enumerate(widths):
+            sheet[0].set_column(idx, idx, width)
+
+    def close(self):
+        self.workbook.close()
+
+
+class OpenpyxlBook:
+    """One workbook written with openpyxl's write_only mode
+
+    A write-only sheet needs its column widths before the first row, so rows are
+    spooled chunk by chunk to a temporary file per sheet and replayed on close.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sheets = []
+
+    def add_sheet(self, name, columns):
+        sheet = {'name': name, 'columns': list(columns), 'spool': tempfile.TemporaryFile(), 'widths': None}
+        self.sheets.append(sheet)
+        return sheet
+
+    def append(self, sheet, rows):
+        pickle.dump(rows, sheet['spool'], protocol=pickle.HIGHEST_PROTOCOL)
+
+    def finish_sheet(self, sheet, widths):
+        sheet['widths'] = widths
+
+    def close(self):
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Alignment, Border, Font, Side
+        from openpyxl.utils import get_column_letter
+
+        workbook = Workbook(write_only=True)
+        thin = Side(style='thin')
+        for spooled in self.sheets:
+            sheet = workbook.create_sheet(spooled['name'])
+            for idx, width in enumerate(spooled['widths'] or []):
+                sheet.column_dimensions[get_column_letter(idx + 1)].width = width
+
+            header = []
+            for column in spooled['columns']:
+                cell = WriteOnlyCell(sheet, value=column)
+                cell.font = Font(bold=True)
+                cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+                cell.alignment = Alignment(horizontal='center', vertical='top')
+                header.append(cell)
+            sheet.append(header)
+
+            spool = spooled['spool']
+            spool.seek(0)
+            while True:
+                try:
+                    rows = pickle.load(spool)
+                except EOFError:
+                    break
+                for row in rows:
+                    sheet.append(row)
+            spool.close()
+        workbook.save(self.path)
+
+
+BACKENDS = {'xlsxwriter': XlsxWriterBook, 'openpyxl': OpenpyxlBook}
+
+
+def _pick_backend(backend):
+    """Resolve 'auto' to xlsxwriter when it is installed, openpyxl otherwise"""
+    if backend == 'auto':
+        try:
+            import xlsxwriter  # noqa: F401
+            return 'xlsxwriter'
+        except ImportError:
+            return 'openpyxl'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown Excel backend {backend!r}, expected 'xlsxwriter', 'openpyxl' or 'auto'")
+    return backend
+
+
+def _safe_name(text):
+    """Make a partition key usable in sheet and file names"""
+    return re.sub(r'[\\/*?:\[\]<>|"\s]+', '_', str(text)) or '_'
+
+
+class _Shard:
+    """A sheet that is being filled, with its own row count and column widths"""
+
+    def __init__(self, book, sheet, path, name, widths):
+        self.book = book
+        self.sheet = sheet
+        self.path = path
+        self.name = name
+        self.widths = widths
+        self.rows = 0
+
+
+class ExcelSink:
+    """Writes chunks of extracted columns to Excel, rolling over to new sheets or files
+
+    Call write() with a dict of column name -> list for each chunk, then close().
+    A sheet holds at most shard_rows data rows; after that rows continue on
+    'Transactions_2', 'Transactions_3'... or, with shard_files, in out_2.xlsx, out_3.xlsx...
+    With partition_by ('account_id', 'day', ...) every key gets its own run of sheets or files.
+    In file mode a shard's workbook is closed and written out as soon as it is full.
+    """
+
+    def __init__(self, path, columns, backend=EXCEL_BACKEND, sheet_name=SHEET_NAME,
+                 width_sample_rows=WIDTH_SAMPLE_ROWS, shard_rows=SHARD_ROWS,
+                 shard_files=SHARD_FILES, partition_by=PARTITION_BY):
+        if not 0 < shard_rows <= MAX_SHEET_ROWS - 1:
+            raise ValueError(f"shard_rows must be between 1 and {MAX_SHEET_ROWS - 1}")
+        self.book_class = BACKENDS[_pick_backend(backend)]
+        self.path = path
+        self.columns = list(columns)
+        self.sheet_name = sheet_name
+        self.width_sample_rows = width_sample_rows
+        self.shard_rows = shard_rows
+        self.shard_files = shard_files
+        self.partition_by = partition_by
+        if partition_by == 'day':
+            # the readable date already has the configured timezone applied
+            self.partition_column = 'readable_value_date'
+        else:
+            self.partition_column = partition_by
+        if self.partition_column is not None and self.partition_column not in self.columns:
+            raise ValueError(f"Cannot partition by {partition_by!r}, it is not an output column")
+
+        self.rows = 0
+        self.shards = []  # (path, sheet name, rows) of every finished shard
+        self.open_shards = {}  # partition key -> shard being filled
+        self.shard_counts = {}  # partition key -> number of shards started
+        self.book = None  # the single workbook in sheet mode
+        self.sheet_names = set()
+        self.tables = []  # (path, sheet name, rows) of the tables added with add_table
+
+    def _partition_key(self, value):
+        if value is None:
+            return 'none'
+        if self.partition_by == 'day':
+            return value[:10]
+        return value
+
+    def _shard_name(self, key, number):
+        """Sheet name (<= 31 chars, unique in the workbook) for shard number of a key"""
+        suffix = '' if number == 1 else f'_{number}'
+        base = self.sheet_name if key is None else _safe_name(key)
+        name = base[:31 - len(suffix)] + suffix
+        bump = 2
+        while name.lower() in self.sheet_names:
+            # two long keys were cut down to the same name
+            extra = f'_{bump}'
+            name = base[:31 - len(suffix) - len(extra)] + extra + suffix
+            bump += 1
+        return name
+
+    def _shard_path(self, key, number):
+        stem, ext = os.path.splitext(self.path)
+        if key is not None:
+            stem = f'{stem}_{_safe_name(key)}'
+        return stem + ext if number == 1 else f'{stem}_{number}{ext}'
+
+    def _open_shard(self, key):
+        number = self.shard_counts.get(key, 0) + 1
+        self.shard_counts[key] = number
+        if self.shard_files:
+            path = self._shard_path(key, number)
+            book = self.book_class(path)
+            name = self.sheet_name
+        else:
+            if self.book is None:
+                self.book = self.book_class(self.path)
+            path = self.path
+            book = self.book
+            name = self._shard_name(key, number)
+            self.sheet_names.add(name.lower())
+        sheet = book.add_sheet(name, self.columns)
+        shard = _Shard(book, sheet, path, name, ColumnWidths(self.columns, self.width_sample_rows))
+        self.open_shards[key] = shard
+        return shard
+
+    def _finish_shard(self, key):
+        shard = self.open_shards.pop(key)
+        shard.book.finish_sheet(shard.sheet, shard.widths.widths())
+        if self.shard_files:
+            shard.book.close()
+        self.shards.append((shard.path, shard.name, shard.rows))
+
+    def _write_group(self, key, values):
+        """Write the rows of one partition, given as column lists, rolling over when a shard fills"""
+        total = len(values[0])
+        start = 0
+        while start < total:
+            shard = self.open_shards.get(key) or self._open_shard(key)
+            stop = min(total, start + self.shard_rows - shard.rows)
+            if start == 0 and stop == total:
+                part = values
+            else:
+                part = [column_values[start:stop] for column_values in values]
+            with stage('width_autosize'):
+                shard.widths.update(part)
+            shard.book.append(shard.sheet, list(zip(*part)))
+            shard.rows += stop - start
+            if shard.rows >= self.shard_rows:
+                self._finish_shard(key)
+            start = stop
+
+    def write(self, chunk):
+        """Write one chunk of extracted columns"""
+        values = [chunk[column] for column in self.columns]
+        if not values or not values[0]:
+            return
+        if self.partition_column is None:
+            self._write_group(None, values)
+        else:
+            positions = {}
+            for idx, value in enumerate(chunk[self.partition_column]):
+                positions.setdefault(self._partition_key(value), []).append(idx)
+            for key, idxs in positions.items():
+                self._write_group(key, [take_rows(column_values, idxs) for column_values in values])
+        self.rows += len(values[0])
+
+    def add_table(self, name, columns, rows):
+        """Write a finished table (a summary) to its own sheet, or its own workbook with shard_files"""
+        if self.shard_files:
+            stem, ext = os.path.splitext(self.path)
+            path = f'{stem}_{_safe_name(name).lower()}{ext}'
+            book = self.book_class(path)
+        else:
+            if self.book is None:
+                self.book = self.book_class(self.path)
+            path, book = self.path, self.book
+        sheet_name = re.sub(r'[\\/*?:\[\]]', '_', name)[:31]
+        while sheet_name.lower() in self.sheet_names:
+            sheet_name = sheet_name[:29] + '_2'
+        self.sheet_names.add(sheet_name.lower())
+        sheet = book.add_sheet(sheet_name, columns)
+        widths = ColumnWidths(columns)
+        widths.update([list(values) for values in zip(*rows)] if rows else [[] for _ in columns])
+        book.append(sheet, rows)
+        book.finish_sheet(sheet, widths.widths())
+        if self.shard_files:
+            book.close()
+        self.tables.append((path, sheet_name, len(rows)))
+
+    def close(self):
+        if not self.open_shards and not self.shards:
+            # nothing was written, still produce a workbook with just the header
+            self._open_shard(None)
+        for key in list(self.open_shards):
+            self._finish_shard(key)
+        if self.book is not None:
+            self.book.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_excel_sink(path, columns, backend=EXCEL_BACKEND, sheet_name=SHEET_NAME,
+                    width_sample_rows=WIDTH_SAMPLE_ROWS, shard_rows=SHARD_ROWS,
+                    shard_files=SHARD_FILES, partition_by=PARTITION_BY):
+    """Open the Excel writer for the chosen backend ('xlsxwriter', 'openpyxl' or 'auto')"""
+    return ExcelSink(path, columns, backend, sheet_name, width_sample_rows,
+                     shard_rows, shard_files, partition_by)
+
+
+class CsvSink:
+    """Writes chunks of extracted columns to a CSV file, None becomes an empty field
+
+    With append=True rows are added to the end of an existing file and no second header is written.
+    A path ending in .gz, .bz2 or .zst is compressed while it is written.
+    """
+
+    def __init__(self, path, columns, append=False):
+        self.path = path
+        self.columns = list(columns)
+        self.rows = 0
+        append = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open_text_output(path, newline='', append=append)
+        self.writer = csv.writer(self.file)
+        if not append:
+            self.writer.writerow(self.columns)
+
+    def write(self, chunk):
+        values = [chunk[column] for column in self.columns]
+        self.writer.writerows(zip(*values))
+        self.rows += len(values[0]) if values else 0
+
+    def flush(self):
+        """Push the rows written so far to the file, so readers see them before it is closed"""
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NdjsonSink:
+    """Writes one JSON object per row and line (NDJSON), None becomes null
+
+    Like CsvSink it can append to an existing file and compresses .gz, .bz2 and .zst paths.
+    """
+
+    def __init__(self, path, columns, append=False):
+        self.path = path
+        self.columns = list(columns)
+        self.rows = 0
+        self.file = open_text_output(path, append=append)
+
+    def write(self, chunk):
+        columns = self.columns
+        lines = [json.dumps(dict(zip(columns, row))) for row in zip(*[chunk[column] for column in columns])]
+        if lines:
+            self.file.write('\n'.join(lines) + '\n')
+        self.rows += len(lines)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _arrow_type(kind, amount_type=AMOUNT_TYPE):
+    import pyarrow as pa
+
+    if kind == 'amount':
+        return pa.decimal128(38, 18) if amount_type == 'decimal' else pa.float64()
+    if kind == 'dictionary':
+        return pa.dictionary(pa.int32(), pa.string())
+    return {'bool': pa.bool_(), 'int64': pa.int64(), 'string': pa.string()}[kind]
+
+
+def _dictionary_codes(values, lookup, dictionary):
+    """Encode values as positions in dictionary, adding new values to lookup/dictionary as they appear"""
+    codes = []
+    append = codes.append
+    for value in values:
+        if value is None:
+            append(None)
+            continue
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(dictionary)
+            dictionary.append(value if isinstance(value, str) else str(value))
+        append(code)
+    return codes
+
+
+def _array_or_nulls(values, arrow_type, from_text=False):
+    """values as an Arrow array of arrow_type, None for each value that doesn't convert
+
+    'abc' as an amount or 'yes' as a bool would otherwise fail the whole output, where the
+    text outputs write the chunk fine (json_validate reports such values as wrong types).
+    from_text casts decimal strings with Arrow's own parser.
+    """
+    import pyarrow as pa
+
+    errors = (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, TypeError, ValueError, OverflowError)
+
+    def convert(items):
+        if from_text:
+            return pa.array(items, type=pa.string()).cast(arrow_type)
+        return pa.array(items, type=arrow_type)
+
+    try:
+        return convert(values)
+    except errors:
+        pass
+    fitting = []
+    for value in values:  # only for a chunk with a bad value in it
+        try:
+            convert([value])
+        except errors:
+            value = None
+        fitting.append(value)
+    return convert(fitting)
+
+
+def _arrow_array(values, kind, arrow_type, lookup=None, dictionary=None):
+    """Build one typed Arrow column from a list of extracted values
+
+    Dictionary columns share one growing dictionary (lookup/dictionary) across chunks, so an
+    Arrow IPC file only ever sees additions to it, which it can store as dictionary deltas.
+    """
+    import numpy as np
+    import pyarrow as pa
+
+    if kind == 'dictionary':
+        if getattr(values, 'codes', None) is not None:
+            # dictionary-encoded by the extraction (json_extract.DictColumn), only its distinct values are looked up
+            remap = np.array([-1 if code is None else code
+                              for code in _dictionary_codes(values.dictionary, lookup, dictionary)], dtype=np.int32)
+            indices = remap[values.codes]
+            codes = pa.array(indices, mask=indices < 0, type=pa.int32())
+        else:
+            codes = pa.array(_dictionary_codes(values, lookup, dictionary), type=pa.int32())
+        return pa.DictionaryArray.from_arrays(codes, pa.array(dictionary, type=pa.string()))
+    if kind == 'amount' and getattr(values, 'units', None) is not None:
+        # fixed point from the extraction (json_columns.AmountColumn), no text to parse
+        if pa.types.is_floating(arrow_type):
+            return pa.array(values.floats(), mask=values.missing, type=arrow_type)
+        fixed = values.fixed_point()
+        if fixed is not None:
+            units, scale = fixed
+            # decimal128 is a 16 byte little-endian integer: the units and their sign extension
+            words = np.stack([units, units >> 63], axis=1)
+            missing = values.missing
+            validity = pa.py_buffer(np.packbits(~missing, bitorder='little')) if missing.any() else None
+            array = pa.Array.from_buffers(pa.decimal128(38, scale), len(units), [validity, pa.py_buffer(words)])
+            return array.cast(arrow_type)
+    if kind == 'amount':
+        # amounts arrive as decimal strings, Arrow parses them itself
+        return _array_or_nulls([value if value is None or isinstance(value, str) else str(value) for value in values],
+                               arrow_type, from_text=True)
+    if kind == 'string':
+        values = [value if value is None or isinstance(value, str) else str(value) for value in values]
+    elif getattr(values, 'missing', None) is not None:
+        # a typed column from the extraction, IntColumn or BoolColumn
+        data = values.flags if hasattr(values, 'flags') else values.values
+        return pa.array(data, mask=values.missing, type=arrow_type)
+    return _array_or_nulls(values, arrow_type)
+
+
+class ArrowSink:
+    """Writes chunks of extracted columns to Parquet (one row group per chunk) or an Arrow IPC file
+
+    Columns get real types from ARROW_TYPES: int64 timestamps, decimal or float amount,
+    bool credit and dictionary-encoded denomination, asset, phase, account_type and so on.
+    """
+
+    def __init__(self, path, columns, file_format='parquet', amount_type=AMOUNT_TYPE):
+        import pyarrow as pa
+
+        self.path = path
+        self.columns = list(columns)
+        self.rows = 0
+        self.kinds = [ARROW_TYPES.get(column, 'string') for column in self.columns]
+        self.types = [_arrow_type(kind, amount_type) for kind in self.kinds]
+        self.schema = pa.schema(list(zip(self.columns, self.types)))
+        self.lookups = [{} for _ in self.columns]
+        self.dictionaries = [[] for _ in self.columns]
+        if file_format == 'parquet':
+            import pyarrow.parquet as pq
+
+            self.writer = pq.ParquetWriter(path, self.schema)
+        elif file_format == 'ipc':
+            options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self.writer = pa.ipc.new_file(path, self.schema, options=options)
+        else:
+            raise ValueError(f"Unknown Arrow file format {file_format!r}, expected 'parquet' or 'ipc'")
+
+    def write(self, chunk):
+        import pyarrow as pa
+
+        arrays = [_arrow_array(chunk[column], kind, arrow_type, lookup, dictionary)
+                  for column, kind, arrow_type, lookup, dictionary
+                  in zip(self.columns, self.kinds, self.types, self.lookups, self.dictionaries)]
+        table = pa.Table.from_arrays(arrays, schema=self.schema)
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# outputs that new rows can be added to the end of
+APPENDABLE = {'csv': CsvSink, 'ndjson': NdjsonSink}
+
+
+def write_table(sink, name, columns, rows):
+    """Add a finished table (a summary) to an open output, returns where it went (None for nowhere)
+
+    Workbooks get a sheet and SQLite stores a table. With TABLE_FILES the other formats get a
+    file of their own next to the output: name 'By day' with transactions.csv.gz gives
+    transactions_by_day.csv.gz.
+    """
+    if hasattr(sink, 'add_table'):
+        sink.add_table(name, columns, rows)
+        return sink.path
+    if not TABLE_FILES:
+        return None
+    base, _ = split_suffix(sink.path)
+    stem, ext = os.path.splitext(base)
+    path = f'{stem}_{_safe_name(name).lower()}{ext}{sink.path[len(base):]}'
+    values = dict(zip(columns, map(list, zip(*rows)))) if rows else {column: [] for column in columns}
+    file_format = sink_format(sink.path)
+    if file_format in ('parquet', 'ipc'):
+        import pyarrow as pa
+
+        arrays = {}
+        for column, column_values in values.items():  # inferred types: float totals, int counts
+            try:
+                arrays[column] = pa.array(column_values)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):  # a key column with text and numbers from bad records
+                arrays[column] = pa.array([None if value is None else str(value) for value in column_values])
+        table = pa.table(arrays)
+        if file_format == 'parquet':
+            import pyarrow.parquet as pq
+
+            pq.write_table(table, path)
+        else:
+            with pa.ipc.new_file(path, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        with APPENDABLE[file_format](path, columns) as table_sink:
+            table_sink.write(values)
+    return path
+
+
+# output file extension -> format
+SINK_FORMATS = {
+    '.xlsx': 'excel',
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.parquet': 'parquet',
+    '.arrow': 'ipc',
+    '.feather': 'ipc',
+    '.ipc': 'ipc',
+    '.db': 'sqlite',
+    '.sqlite': 'sqlite',
+    '.sqlite3': 'sqlite',
+}
+
+
+def sink_format(path):
+    """The output format for path from SINK_FORMATS, looking past a .gz/.bz2/.zst suffix"""
+    return SINK_FORMATS.get(os.path.splitext(split_suffix(path)[0])[1].lower())
+
+
+def open_sink(path, columns, source=None, **excel_options):
+    """Open the writer that matches the file extension of path (.xlsx, .csv, .ndjson, .parquet, .arrow, .db)
+
+    excel_options are passed on to open_excel_sink for .xlsx outputs, source (the input
+    file) is recorded in the load log of a .db store. CSV and NDJSON outputs can be
+    compressed by adding .gz, .bz2 or .zst (e.g. transactions.csv.gz).
+    """
+    file_format = sink_format(path)
+    if split_suffix(path)[1] and file_format not in ('csv', 'ndjson'):
+        raise ValueError(f"Only CSV and NDJSON outputs can be compressed, not {path!r}")
+    if file_format == 'sqlite':
+        from json_store import SqliteSink
+
+        return SqliteSink(path, columns, source=source)
+    if file_format == 'excel':
+        return open_excel_sink(path, columns, **excel_options)
+    if file_format == 'csv':
+        return CsvSink(path, columns)
+    if file_format == 'ndjson':
+        return NdjsonSink(path, columns)
+    if file_format in ('parquet', 'ipc'):
+        return ArrowSink(path, columns, file_format)
+    raise ValueError(f"Don't know how to write {path!r}, use one of {', '.join(SINK_FORMATS)}")
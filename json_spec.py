@@ -0,0 +1,154 @@
+#Column spec: which output column comes from where in a record, written as path expressions
+#
+#   posting_instruction_batch.id                     - keys separated by dots
+#   posting_instruction_batch.posting_instructions[0] - [n] picks the n-th item of a list
+#   instruction_details[key=account_type].value       - [field=value] picks the first dict with that field
+#   a.b | a.c                                         - the first alternative that exists wins
+#
+# A path that doesn't exist in a record gives None (a key that exists with null gives None too,
+# but stops the search through the alternatives).
+import json
+import re
+
+_TOKEN = re.compile(r'\s*(?:(\|)|\.?([A-Za-z_]\w*)|\[\s*(-?\d+)\s*\]|\[\s*([A-Za-z_]\w*)\s*=\s*([^\]]*?)\s*\])')
+_MISSING = object()
+
+# The common places are extracted together in one walk over the record by json_extract, as (source, key):
+_BATCH = (('key', 'posting_instruction_batch'),)
+_INSTRUCTION = _BATCH + (('key', 'posting_instructions'), ('index', 0))
+_COMMITTED = _INSTRUCTION + (('key', 'committed_postings'), ('index', 0))
+_CUSTOM = _INSTRUCTION + (('key', 'custom_instruction'), ('key', 'postings'), ('index', 0))
+
+
+def parse_path(expr):
+    """Parse a path expression into a tuple of alternatives, each a tuple of (kind, ...) steps"""
+    alternatives = []
+    steps = []
+    pos = 0
+    expr = expr.strip()
+    while pos < len(expr):
+        match = _TOKEN.match(expr, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"Can't read path {expr!r} at position {pos}")
+        bar, key, index, field, value = match.groups()
+        if bar:
+            alternatives.append(tuple(steps))
+            steps = []
+        elif key:
+            steps.append(('key', key))
+        elif index is not None:
+            steps.append(('index', int(index)))
+        else:
+            steps.append(('match', field, value))
+        pos = match.end()
+    alternatives.append(tuple(steps))
+    if not all(alternatives):
+        raise ValueError(f"Empty alternative in path {expr!r}")
+    return tuple(alternatives)
+
+
+def _compile_steps(steps):
+    """Chain one small function per step, innermost last, returning _MISSING when the path breaks off"""
+    def done(value):
+        return value
+    step = done
+    for kind, *args in reversed(steps):
+        step = _STEP_BUILDERS[kind](step, *args)
+    return step
+
+
+def _key_step(next_step, key):
+    def step(value):
+        if isinstance(value, dict) and key in value:
+            return next_step(value[key])
+        return _MISSING
+    return step
+
+
+def _index_step(next_step, index):
+    def step(value):
+        if isinstance(value, list) and -len(value) <= index < len(value):
+            return next_step(value[index])
+        return _MISSING
+    return step
+
+
+def _match_step(next_step, field, wanted):
+    def step(value):
+        if isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and item.get(field) == wanted:
+                    return next_step(item)
+        return _MISSING
+    return step
+
+
+_STEP_BUILDERS = {'key': _key_step, 'index': _index_step, 'match': _match_step}
+
+
+def compile_path(expr):
+    """Compile a path expression into a function record -> value (None when no alternative exists)"""
+    alternatives = [_compile_steps(steps) for steps in parse_path(expr)]
+    if len(alternatives) == 1:
+        only = alternatives[0]
+
+        def get(record):
+            value = only(record)
+            return None if value is _MISSING else value
+        return get
+
+    def get(record):
+        for alternative in alternatives:
+            value = alternative(record)
+            if value is not _MISSING:
+                return value
+        return None
+    return get
+
+
+def to_field(expr):
+    """Turn a path expression into the (source, key) pair json_extract understands
+
+    Paths to the record, the batch, the first instruction, its first posting (committed,
+    falling back to custom_instruction) or one of its instruction_details become the
+    matching source so they share one walk over the record; anything else is ('path', expr).
+    """
+    alternatives = parse_path(expr)
+    steps = alternatives[0]
+    *prefix, last = steps
+    prefix = tuple(prefix)
+    if len(alternatives) == 1 and last[0] == 'key':
+        for source, base in (('record', ()), ('batch', _BATCH), ('instruction', _INSTRUCTION)):
+            if prefix == base:
+                return source, last[1]
+        if (last[1] == 'value' and len(prefix) == len(_INSTRUCTION) + 2 and prefix[:-2] == _INSTRUCTION
+                and prefix[-2] == ('key', 'instruction_details') and prefix[-1][:2] == ('match', 'key')):
+            return 'detail', prefix[-1][2]
+    if (len(alternatives) == 2 and last[0] == 'key' and prefix == _COMMITTED
+            and alternatives[1] == _CUSTOM + (last,)):
+        return 'posting', last[1]
+    return 'path', expr
+
+
+def to_path(source, key):
+    """The path expression for a (source, key) pair from to_field, so one column can be read on its own"""
+    instruction = 'posting_instruction_batch.posting_instructions[0].'
+    if source == 'path':
+        return key
+    if source == 'posting':
+        return f'{instruction}committed_postings[0].{key} | {instruction}custom_instruction.postings[0].{key}'
+    if source == 'detail':
+        return f'{instruction}instruction_details[key={key}].value'
+    return {'record': '', 'batch': 'posting_instruction_batch.', 'instruction': instruction}[source] + key
+
+
+def load_spec(path):
+    """Read a column spec file, returns (field_map, column_order)
+
+    The file is JSON: {"columns": {name: path expression, ...}, "column_order": [...]}.
+    column_order is optional and defaults to the columns in the order they are listed.
+    """
+    with open(path, 'r') as f:
+        spec = json.load(f)
+    field_map = {column: to_field(expr) for column, expr in spec['columns'].items()}
+    return field_map, spec.get('column_order', list(field_map))
@@ -0,0 +1,286 @@
+#Persistent SQLite store for the extracted transactions, so reports don't have to re-read out.json
+import hashlib
+import os
+import re
+import sqlite3
+import time
+
+from json_columns import take_rows
+from json_extract import timestamps_to_ms, encode_categories, encode_typed
+
+STORE_FILE = 'transactions.db'
+TABLE = 'transactions'
+
+# SQLite type per output column, anything not listed is TEXT (amount stays TEXT so it round-trips exactly)
+SQL_TYPES = {
+    'credit': 'INTEGER',
+    'value_timestamp': 'INTEGER',  # epoch milliseconds, whatever unit the input used
+    'booking_timestamp': 'INTEGER',
+}
+TIMESTAMP_COLUMNS = ('value_timestamp', 'booking_timestamp')
+INDEXED_COLUMNS = ('batch_id', 'account_id', 'value_timestamp')
+
+# Reports that can be run straight from the store, parameters are bound by name
+REPORTS = {
+    # the json_sql_excel.py report
+    'transactions': """
+        SELECT
+            batch_id,
+            credit,
+            amount,
+            denomination,
+            account_id,
+            account_address,
+            asset,
+            phase,
+            internal_account_processing_label,
+            posting_instruction_id,
+            DATETIME(value_timestamp/1000, 'unixepoch') AS value_timestamp,
+            DATETIME(booking_timestamp/1000, 'unixepoch') AS booking_timestamp
+        FROM transactions
+        ORDER BY transactions.value_timestamp DESC
+    """,
+    'account_history': """
+        SELECT *
+        FROM transactions
+        WHERE account_id = :account_id
+        ORDER BY value_timestamp DESC
+    """,
+    'batch': """
+        SELECT *
+        FROM transactions
+        WHERE batch_id = :batch_id
+    """,
+    'between': """
+        SELECT *
+        FROM transactions
+        WHERE value_timestamp >= :start_ms AND value_timestamp < :end_ms
+        ORDER BY value_timestamp
+    """,
+}
+
+
+def connect(path=STORE_FILE):
+    """Open the store with WAL journaling, so reports can read while a load is running"""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+
+def create_schema(conn, columns, replace=False):
+    """Create the transactions table (dropping the old one when replace is set) and the load log"""
+    if replace:
+        conn.execute(f'DROP TABLE IF EXISTS {TABLE}')
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'load_log'").fetchone():
+            conn.execute('DELETE FROM load_log')  # the loads it lists are gone with the table
+    definitions = ', '.join(f'{column} {SQL_TYPES.get(column, "TEXT")}' for column in columns)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} ({definitions})')
+    conn.execute("""CREATE TABLE IF NOT EXISTS load_log (
+        source TEXT, size INTEGER, mtime_ns INTEGER, rows INTEGER, loaded_at REAL)""")
+    # where an incremental load stopped reading each input file
+    conn.execute("""CREATE TABLE IF NOT EXISTS checkpoints (
+        source TEXT PRIMARY KEY, byte_offset INTEGER, digest TEXT, last_timestamp INTEGER, rows INTEGER,
+        updated_at REAL)""")
+
+
+def table_columns(conn, table=TABLE):
+    """The column names of a table in the store, in table order"""
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def create_indexes(conn):
+    """Index the INDEXED_COLUMNS the table has, a COLUMNS projection can leave some out"""
+    present = set(table_columns(conn))
+    for column in INDEXED_COLUMNS:
+        if column not in present:
+            continue
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{TABLE}_{column} ON {TABLE} ({column})')
+
+
+class SqliteSink:
+    """Loads chunks of extracted columns into the store in one transaction
+
+    Durability is switched off (synchronous=OFF) while loading and the indexes are built
+    once at the end, which is much faster than keeping them up to date row by row.
+    Timestamps are stored as epoch milliseconds. With replace=False rows are appended to
+    what is already stored, see drop_known_batches for skipping batches loaded before.
+    """
+
+    def __init__(self, path, columns, replace=True, source=None):
+        self.path = path
+        self.columns = list(columns)
+        self.source = source
+        self.rows = 0
+        self.skipped = 0
+        self.last_timestamp = None
+        self.checkpointed_rows = 0  # rows already counted in a checkpoint
+        self.conn = connect(path)
+        self.conn.execute('PRAGMA synchronous=OFF')
+        self.conn.execute('BEGIN')
+        create_schema(self.conn, self.columns, replace)
+        if not replace:
+            create_indexes(self.conn)  # drop_known_batches looks batch ids up while appending
+        # rows up to here were stored by earlier loads
+        self.stored_rowid = self.conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {TABLE}').fetchone()[0]
+        placeholders = ', '.join('?' for _ in self.columns)
+        self.insert = f'INSERT INTO {TABLE} ({", ".join(self.columns)}) VALUES ({placeholders})'
+
+    def write(self, chunk):
+        values = []
+        for column in self.columns:
+            column_values = chunk[column]
+            if column in TIMESTAMP_COLUMNS:
+                ms, missing = timestamps_to_ms(column_values)
+                column_values = [None if gap else value for value, gap in zip(ms.tolist(), missing.tolist())]
+                if column == 'value_timestamp' and not missing.all():
+                    latest = int(ms[~missing].max())
+                    self.last_timestamp = max(latest, self.last_timestamp or latest)
+            values.append(column_values)
+        rows = list(zip(*values))
+        self.conn.executemany(self.insert, rows)
+        self.rows += len(rows)
+
+    def drop_known_batches(self, chunk):
+        """Return chunk without the rows of batches that earlier loads already stored
+
+        Batch ids are looked up through the batch_id index a few hundred at a time, so this
+        costs in proportion to the chunk, not to the size of the store.
+        """
+        if not self.stored_rowid:
+            return chunk
+        ids = list({batch_id for batch_id in chunk['batch_id'] if batch_id is not None})
+        known = set()
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            query = (f'SELECT DISTINCT batch_id FROM {TABLE} '
+                     f'WHERE batch_id IN ({", ".join("?" for _ in part)}) AND rowid <= ?')
+            known.update(row[0] for row in self.conn.execute(query, part + [self.stored_rowid]))
+        if not known:
+            return chunk
+        keep = [idx for idx, batch_id in enumerate(chunk['batch_id']) if batch_id not in known]
+        self.skipped += len(chunk['batch_id']) - len(keep)
+        return {name: take_rows(values, keep) for name, values in chunk.items()}
+
+    def save_checkpoint(self, source, offset):
+        """Remember that source has been read up to byte offset, committed together with the rows"""
+        row = self.conn.execute('SELECT last_timestamp, rows FROM checkpoints WHERE source = ?',
+                                (os.path.abspath(source),)).fetchone()
+        last_timestamp, rows = row or (None, 0)
+        if self.last_timestamp is not None:
+            last_timestamp = max(self.last_timestamp, last_timestamp or self.last_timestamp)
+        self.conn.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?)',
+                          (os.path.abspath(source), offset, file_digest(source, offset), last_timestamp,
+                           rows + self.rows - self.checkpointed_rows, time.time()))
+        self.checkpointed_rows = self.rows
+
+    def commit(self):
+        """Commit the rows written so far, so other connections see them, and carry on in a new transaction"""
+        self.conn.commit()
+        self.conn.execute('BEGIN')
+
+    def mark_stored(self):
+        """Count the rows written so far as stored by an earlier load, so drop_known_batches skips their batches"""
+        self.stored_rowid = self.conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {TABLE}').fetchone()[0]
+
+    def add_table(self, name, columns, rows):
+        """Store a finished table (a summary) as summary_<name>, replacing an older one"""
+        table = 'summary_' + re.sub(r'\W+', '_', name).strip('_').lower()
+        self.conn.execute(f'DROP TABLE IF EXISTS {table}')
+        names = ', '.join(f'"{column}"' for column in columns)
+        self.conn.execute(f'CREATE TABLE {table} ({names})')
+        self.conn.executemany(f'INSERT INTO {table} VALUES ({", ".join("?" for _ in columns)})', rows)
+
+    def close(self):
+        create_indexes(self.conn)
+        if self.source is not None:
+            stat = os.stat(self.source)
+            self.conn.execute('INSERT INTO load_log VALUES (?, ?, ?, ?, ?)',
+                              (os.path.abspath(self.source), stat.st_size, stat.st_mtime_ns, self.rows, time.time()))
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def store_is_current(path, source, columns=None):
+    """True when the store's last load came from source as it is on disk now (and holds columns, when given)"""
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(source)
+    conn = sqlite3.connect(path)
+    try:
+        row = conn.execute('SELECT size, mtime_ns FROM load_log WHERE source = ? ORDER BY loaded_at DESC LIMIT 1',
+                           (os.path.abspath(source),)).fetchone()
+        stored = table_columns(conn)
+    except sqlite3.OperationalError:  # not a store written by SqliteSink
+        return False
+    finally:
+        conn.close()
+    return row == (stat.st_size, stat.st_mtime_ns) and (columns is None or set(columns) <= set(stored))
+
+
+def file_digest(path, offset, size=1 << 16):
+    """Hash of the first and the last size bytes before offset, to recognise a file that only grew"""
+    digest = hashlib.sha1(str(offset).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(min(size, offset)))
+        f.seek(max(0, offset - size))
+        digest.update(f.read(offset - f.tell()))
+    return digest.hexdigest()
+
+
+def resume_offset(path, source):
+    """Byte offset in source where the last incremental load stopped, None when it must be read from the start
+
+    Reading can only resume when source still begins with the bytes that load saw,
+    i.e. data was appended to the same file since.
+    """
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    try:
+        row = conn.execute('SELECT byte_offset, digest FROM checkpoints WHERE source = ?',
+                           (os.path.abspath(source),)).fetchone()
+    except sqlite3.OperationalError:  # no checkpoints table yet
+        return None
+    finally:
+        conn.close()
+    if row is None or os.path.getsize(source) < row[0] or file_digest(source, row[0]) != row[1]:
+        return None
+    return row[0]
+
+
+def iter_store_chunks(path, columns, chunk_size):
+    """Yield everything in the store as dicts of columns, in load order, like the extraction does
+
+    credit comes back as True/False, the timestamps as epoch milliseconds, the
+    low-cardinality columns dictionary-encoded and the TYPED_COLUMNS in typed buffers.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        cursor = conn.execute(f'SELECT {", ".join(columns)} FROM {TABLE} ORDER BY rowid')
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            chunk = dict(zip(columns, map(list, zip(*rows))))
+            if 'credit' in chunk:
+                chunk['credit'] = [None if value is None else bool(value) for value in chunk['credit']]
+            yield encode_typed(encode_categories(chunk))
+    finally:
+        conn.close()
+
+
+def run_report(path, name, **params):
+    """Run one of REPORTS against the store and return a pandas DataFrame"""
+    import pandas as pd
+
+    conn = sqlite3.connect(path)
+    try:
+        return pd.read_sql_query(REPORTS[name], conn, params=params)
+    finally:
+        conn.close()
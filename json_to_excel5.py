@@ -1,164 +1,360 @@
 #Importing Necessary Libraries
+import itertools
 import json
-import pandas as pd
-import datetime
-from datetime import timezone, timedelta  # ADDED: For timezone handling
+import sys
+from contextlib import ExitStack
+
+import numpy as np
+
+from json_reader import (iter_records, iter_chunks, iter_range_records, detect_format, first_record_offset,
+                         end_of_records, pick_parser, JSON_PARSER)
+from json_columns import IntColumn, concat_columns, take_rows
+from json_extract import (extract_chunk, timestamps_to_ms, column_order, field_map, RECORD_FIELDS, TIMEZONE,
+                          TIMESTAMP_UNIT)
+from json_sinks import (open_sink, sink_format, write_table, APPENDABLE, EXCEL_BACKEND, WIDTH_SAMPLE_ROWS,
+                        SHARD_ROWS, SHARD_FILES, PARTITION_BY)
+from json_parallel import iter_extracted_parallel
+from json_store import SqliteSink, STORE_FILE, resume_offset, iter_store_chunks
+from json_cache import iter_cached
+from json_compression import detect_compression
+from json_metrics import RunStats, stage, timed, progress, write_summary
+from json_follow import follow
+from json_aggregate import Aggregator, DAY
+from json_query import make_query, TIMESTAMP_COLUMNS
+from json_validate import Validator
 
 #new functions needed as Account type is not in the same place as the other fields
+#extraction lives in json_extract.py, reading in json_reader.py, writing in json_sinks.py
+#to convert other files without editing the settings below use the json-converter command (json_convert.py)
 
-# Load JSON data
-with open('out.json', 'r') as f: #r is read mode
-    data = json.load(f)
-
-# Convert to pandasDataFrame
-df = pd.DataFrame(data) # like a temporary db table in memory
-
-
-extracted_data = pd.DataFrame() #empty DataFrame to store extracted data
-
-# Extract batch_id from posting_instruction_batch
-if 'posting_instruction_batch' in df.columns:
-    # Extract batch_id
-    extracted_data['batch_id'] = df['posting_instruction_batch'].apply(
-        lambda x: x.get('id') if isinstance(x, dict) else None
-    )#checks if there is a row & lambda processes each row in the column
-    
-    # Function to extract posting data from the correct location
-    def extract_posting_fields(batch, field_name):
-        """Extract fields from the correct location in the JSON structure"""
-        if not isinstance(batch, dict):
-            return None
-            
-        # Get posting instructions
-        instructions = batch.get('posting_instructions', [])
-        if not instructions or not isinstance(instructions, list) or len(instructions) == 0:
-            return None
-            
-        # Get the first instruction
-        instruction = instructions[0]
-        if not isinstance(instruction, dict):
-            return None
-            
-        # Try committed_postings may be a more reliable methid for some entries
-        committed = instruction.get('committed_postings', [])
-        if committed and isinstance(committed, list) and len(committed) > 0:
-            # Use the first posting entry
-            if isinstance(committed[0], dict) and field_name in committed[0]:
-                return committed[0].get(field_name)
-        
-    
-        custom = instruction.get('custom_instruction', {})
-        postings = custom.get('postings', []) if isinstance(custom, dict) else []
-        # some entries have no value for custom_instruction as some entries are null
-        if postings and isinstance(postings, list) and len(postings) > 0:
-            # Use the first posting entry
-            if isinstance(postings[0], dict) and field_name in postings[0]:
-                return postings[0].get(field_name)
-        
-        return None
+INPUT_FILE = 'out.json'  # JSON array or NDJSON (one record per line), may be gzip, bz2 or zstd compressed
+OUTPUT_FILE = 'transaction_data_fixed_final2.xlsx'  # Change filename here when needed
+# Every output is written from the same extraction pass, the format follows the extension:
+# .xlsx, .csv, .ndjson, .parquet, .arrow (Parquet and Arrow need pyarrow) or .db (SQLite store, see json_store.py)
+# .csv and .ndjson outputs are compressed when the name ends in .gz, .bz2 or .zst
+OUTPUT_FILES = [OUTPUT_FILE]  # e.g. [OUTPUT_FILE, 'transactions.parquet', 'transactions.csv.gz']
+CHUNK_SIZE = 50000  # records extracted at a time, keeps memory bounded
+WORKERS = 1  # processes extracting in parallel, 1 runs in this process, None uses every CPU (not for compressed input)
+ORDER_BY = None  # None keeps input order, ('value_timestamp', 'desc') matches json_sql_excel.py
+EXPLODE = False  # True gives one row per posting of every instruction, not just the first posting
+# Only extract the rows and columns that are needed (full runs only), see json_query.py for the filter syntax
+FILTERS = []  # e.g. [('account_id', '==', '253b780b-...'), ('value_timestamp', '>=', '2025-04-01')], all must hold
+COLUMNS = None  # output columns to keep, in this order, e.g. ['batch_id', 'credit', 'amount'], None for all
+# True only extracts batches that are not in the store yet (the .db in OUTPUT_FILES, else STORE_FILE
+# from json_store.py) and appends them, so a daily run costs about as much as the new data
+INCREMENTAL = False
+# True keeps watching INPUT_FILE (NDJSON that is being appended to) and adds new batches to the outputs
+# every few seconds until Ctrl+C, see json_follow.py for the latency and workbook roll-over settings
+FOLLOW = False
+CACHE = False  # True keeps the extracted columns in CACHE_DIR, a re-run on an unchanged input skips parsing it
+PROFILE = None  # 'cprofile' or 'tracemalloc' to see where a slow run spends its time or memory (cprofile is slow)
+SUMMARY_FILE = 'run_summary.json'  # the JSON run summary is printed and saved here, None to only print it
+# Summary sheets with the count, total, min and max of debit and credit amounts per group, added to every output
+# (a sheet in a workbook, a summary_ table in a .db, a file next to the others with TABLE_FILES from json_sinks.py).
+# 'day' is the local date of value_timestamp. {} for none. Memory grows with the number of groups, not rows.
+SUMMARIES = {
+    'By account and day': ['account_id', 'denomination', 'day'],
+    'By denomination and day': ['denomination', 'day'],
+}
+# Count missing and wrongly typed values per path, and the records that fall back to custom_instruction.postings,
+# while extracting (about 1% of the run time). The report with sample rows goes next to the SUMMARIES
+# as an 'Anomalies' sheet/table/file, and into the run summary. See json_validate.py
+VALIDATE = True
+#TIMEZONE ('Africa/Cairo') and TIMESTAMP_UNIT ('auto') for the readable dates come from json_extract.py
+#JSON_PARSER ('auto' = pysimdjson, orjson or ujson when installed, else json) comes from json_reader.py
+#EXCEL_BACKEND ('auto', 'xlsxwriter' or 'openpyxl') comes from json_sinks.py
+#WIDTH_SAMPLE_ROWS (None = measure every row) also comes from json_sinks.py, set a number for huge exports
+#SHARD_ROWS, SHARD_FILES and PARTITION_BY (json_sinks.py) control rolling over past Excel's row limit
+#CACHE_DIR (~/.cache/json-converter) and CACHE_MAX_BYTES (json_cache.py) set where the cache lives and its size
+#PROGRESS_SECONDS (json_metrics.py) sets how often rows/s progress is printed to stderr
+
+
+def iter_extracted(path, chunk_size=CHUNK_SIZE, tz=TIMEZONE, unit=TIMESTAMP_UNIT, explode=False, query=None,
+                   validate=False):
+    """Stream records from path and yield a dict of extracted columns per chunk, filtered by query (json_query.py)"""
+    # only the fields the columns use are built from the JSON when the parser can do that
+    fields, prefilter = (RECORD_FIELDS, None) if query is None else (query.fields, query.prefilter)
+    records = iter_records(path, fields=fields, prefilter=prefilter)
+    for records in iter_chunks(timed(records, 'parse'), chunk_size):
+        yield extract_chunk(records, tz, unit, explode, query, validate)
+
+
+def _sort_key(value):
+    """A key that orders values of any types: by type name, then by value (lists and dicts as JSON text)"""
+    name = type(value).__name__
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value, sort_keys=True, default=str)
+    return name, value
+
+
+def iter_sorted(chunks, column, direction='asc', chunk_size=CHUNK_SIZE):
+    """Collect every chunk and yield them again sorted on one column
+
+    The sort is stable and rows with no value go last, like ORDER BY ... DESC in SQLite.
+    Only the extracted columns are held, but all of them at once (typed columns stay in
+    their compact buffers and an IntColumn key is sorted with numpy). Timestamps are sorted
+    as epoch milliseconds whatever their unit or form, a column with values of several types
+    by type name first.
+    """
+    parts = {}
+    for chunk in chunks:
+        for name, values in chunk.items():
+            parts.setdefault(name, []).append(values)
+    if not parts:
+        return
+    merged = {name: concat_columns(values) for name, values in parts.items()}
+    del parts
+    keys = merged[column]
+    descending = direction.lower() == 'desc'
+    if column in TIMESTAMP_COLUMNS or isinstance(keys, IntColumn):
+        # integer text, epoch numbers in different units, ... missing like everywhere else when not a timestamp
+        values, missing = timestamps_to_ms(keys) if column in TIMESTAMP_COLUMNS else (keys.values, keys.missing)
+        present = np.flatnonzero(~missing)
+        values = values[present]
+        # ~values reverses the order without overflowing, and keeps equal keys in their order
+        present = present[np.argsort(~values if descending else values, kind='stable')]
+        order = np.concatenate([present, np.flatnonzero(missing)])
+    else:
+        present = [idx for idx, value in enumerate(keys) if value is not None]
+        try:
+            present.sort(key=keys.__getitem__, reverse=descending)
+        except TypeError:  # text next to numbers, dicts, ...
+            present.sort(key=lambda idx: _sort_key(keys[idx]), reverse=descending)
+        order = present + [idx for idx, value in enumerate(keys) if value is None]
+    for start in range(0, len(order), chunk_size):
+        rows = order[start:start + chunk_size]
+        yield {name: take_rows(values, rows) for name, values in merged.items()}
+
+
+def _chunk_rows(chunk):
+    return len(next(iter(chunk.values()), ()))
+
+
+def _describe_outputs(paths, sinks):
+    """Summary entries for the outputs that were written: path, format, rows and Excel shards"""
+    outputs = []
+    for path, sink in zip(paths, sinks):
+        output = {'path': path, 'format': sink_format(path), 'rows': sink.rows}
+        shards = getattr(sink, 'shards', [])  # only the Excel writer splits into shards
+        if len(shards) > 1:
+            output['shards'] = [{'path': shard_path, 'sheet': sheet_name, 'rows': rows}
+                                for shard_path, sheet_name, rows in shards]
+        outputs.append(output)
+    return outputs
+
+
+def _aggregate(aggregators, chunk):
+    with stage('aggregate'):
+        for aggregator in aggregators:
+            aggregator.update(chunk)
+
+
+def _write_summaries(sinks, aggregators):
+    """Add every summary table to every output, returns the groups and the rows left out per summary"""
+    with stage('write:summaries'):
+        for aggregator in aggregators:
+            columns, rows = aggregator.columns(), aggregator.rows()
+            for sink in sinks:
+                write_table(sink, aggregator.name, columns, rows)
+    for aggregator in aggregators:
+        if aggregator.bad_amounts or aggregator.unknown_credit:
+            print(f"Summary {aggregator.name!r} leaves out {aggregator.bad_amounts} rows with an amount that isn't "
+                  f"a finite number and {aggregator.unknown_credit} rows without a True/False credit",
+                  file=sys.stderr)
+    return {aggregator.name: {'groups': len(aggregator.groups), 'bad_amounts': aggregator.bad_amounts,
+                              'unknown_credit': aggregator.unknown_credit} for aggregator in aggregators}
+
+
+def _validate(validator, chunk):
+    if validator is not None:
+        with stage('validate'):
+            validator.update(chunk)
 
-    # ADDED NEW FUNCTION: Function to extract from instruction_details
-    def extract_instruction_detail(batch, detail_key):
-        """Extract a specific key from instruction_details array in order to get account_type"""
-        if not isinstance(batch, dict):
-            return None
-            
-        # Get posting instructions
-        instructions = batch.get('posting_instructions', [])
-        if not instructions or not isinstance(instructions, list) or len(instructions) == 0:
-            return None
-            
-        # Get the first instruction
-        instruction = instructions[0]
-        if not isinstance(instruction, dict):
-            return None
-        
-        # Get instruction details
-        details = instruction.get('instruction_details', [])
-        if not details or not isinstance(details, list):
-            return None
-        
-        # Find the detail with matching key
-        for detail in details:
-            if isinstance(detail, dict) and detail.get('key') == detail_key:
-                return detail.get('value')
-        
+
+def _write_anomalies(sinks, validator):
+    """Add the anomaly report to every output, returns it for the run summary"""
+    if validator is None:
         return None
+    with stage('write:anomalies'):
+        columns, rows = validator.columns(), validator.rows()
+        for sink in sinks:
+            write_table(sink, validator.name, columns, rows)
+    return validator.summary()
+
+
+def run_incremental():
+    """Append the batches of INPUT_FILE that are not in the store yet and bring the other outputs up to date
+
+    When INPUT_FILE is the file of the last run with data appended to it, reading resumes at
+    the checkpointed byte offset. Otherwise the whole file is read and batches the store
+    already has are skipped, as it always is for compressed input. CSV and NDJSON outputs get
+    the new rows appended, the other outputs (workbooks, Parquet, Arrow) can't be appended to
+    and are written again from the store. Returns the details for the run summary, with
+    the anomalies of the new rows when VALIDATE is on (they are not added to the outputs).
+    """
+    store_path = next((path for path in OUTPUT_FILES if sink_format(path) == 'sqlite'), STORE_FILE)
+    appended = [path for path in OUTPUT_FILES if sink_format(path) in APPENDABLE]
+    compressed = detect_compression(INPUT_FILE) is not None
+    kind = detect_format(INPUT_FILE)
+    start = None if compressed else resume_offset(store_path, INPUT_FILE)
+    end = end_of_records(INPUT_FILE, kind) if kind and not compressed else 0
+    if kind is None:
+        records = iter([])
+    elif compressed or (start is None and kind == 'array'):
+        records = iter_records(INPUT_FILE, fields=RECORD_FIELDS)  # streams, a range is read in one piece
+    else:
+        from_byte = first_record_offset(INPUT_FILE, kind) if start is None else start
+        records = iter_range_records(INPUT_FILE, kind, from_byte, end, fields=RECORD_FIELDS)
+
+    with ExitStack() as stack:
+        store = stack.enter_context(SqliteSink(store_path, column_order, replace=False, source=INPUT_FILE))
+        appended_sinks = [stack.enter_context(APPENDABLE[sink_format(path)](path, column_order, append=True))
+                          for path in appended]
+        validator = Validator(column_order) if VALIDATE else None
+        for records in iter_chunks(timed(records, 'parse'), CHUNK_SIZE):
+            chunk = extract_chunk(records, explode=EXPLODE, validate=VALIDATE)
+            with stage('dedupe'):
+                chunk = store.drop_known_batches(chunk)
+            if not chunk['batch_id']:
+                continue
+            for path, sink in zip([store_path] + appended, [store] + appended_sinks):
+                with stage('write:' + sink_format(path)):
+                    sink.write(chunk)
+            _validate(validator, chunk)
+            progress(_chunk_rows(chunk))
+        if not compressed:  # offsets into a compressed file can't be resumed from
+            store.save_checkpoint(INPUT_FILE, end)
 
-    # Extract each field we need - with credit and amount as separate fields? fix
-    fields_to_extract = {
-        'credit': 'credit',
-        'amount': 'amount',
-        'denomination': 'denomination',
-        'account_id': 'account_id',
-        'account_address': 'account_address',
-        'asset': 'asset',
-        'phase': 'phase',
-        'internal_account_processing_label': 'internal_account_processing_label',
-        'posting_instruction_id': 'id'
+    # Workbooks and Arrow files are rewritten from the store, without parsing JSON again
+    rebuilt = [path for path in OUTPUT_FILES if path != store_path and path not in appended]
+    with ExitStack() as stack:
+        sinks = [stack.enter_context(open_sink(path, column_order, backend=EXCEL_BACKEND,
+                                               width_sample_rows=WIDTH_SAMPLE_ROWS, shard_rows=SHARD_ROWS,
+                                               shard_files=SHARD_FILES, partition_by=PARTITION_BY))
+                 for path in rebuilt]
+        summaries = {}
+        if sinks:
+            # the summaries cover everything in the store, so they go to the rewritten outputs only
+            aggregators = [Aggregator(name, keys, column_order) for name, keys in SUMMARIES.items()]
+            chunks = timed(iter_store_chunks(store_path, column_order, CHUNK_SIZE), 'store_read')
+            if ORDER_BY:
+                chunks = timed(iter_sorted(chunks, *ORDER_BY), 'sort')
+            for chunk in chunks:
+                for path, sink in zip(rebuilt, sinks):
+                    with stage('write:' + sink_format(path)):
+                        sink.write(chunk)
+                _aggregate(aggregators, chunk)
+            summaries = _write_summaries(sinks, aggregators)
+
+    return {
+        'mode': 'incremental',
+        'input': INPUT_FILE,
+        'resumed_at_byte': start,
+        'new_rows': store.rows,
+        'skipped_rows': store.skipped,
+        'latest_value_timestamp': store.last_timestamp,
+        'summaries': summaries,
+        'anomalies': None if validator is None else validator.summary(),
+        'outputs': _describe_outputs([store_path] + appended + rebuilt, [store] + appended_sinks + sinks),
     }
-    
-    # Extract each field
-    for column_name, field_name in fields_to_extract.items():
-        if column_name == 'posting_instruction_id':
-            # Special handling for instruction ID which is in a different place/ column
-            extracted_data[column_name] = df['posting_instruction_batch'].apply(
-                lambda x: x.get('posting_instructions', [{}])[0].get('id') if isinstance(x, dict) and 
-                          'posting_instructions' in x and len(x['posting_instructions']) > 0 else None
-            )
+
+
+def _iter_input_chunks(path, query=None):
+    """Extracted chunks of one input file, in parallel and through the cache as configured"""
+    if WORKERS == 1 or detect_compression(path):  # a compressed file can't be split into byte ranges
+        extract = lambda: iter_extracted(path, CHUNK_SIZE, explode=EXPLODE, query=query, validate=VALIDATE)
+    else:
+        extract = lambda: iter_extracted_parallel(path, WORKERS, explode=EXPLODE, query=query, validate=VALIDATE)
+    if not CACHE:
+        return extract()
+    # the cached columns don't depend on column_order, only on what is extracted and how
+    settings = (sorted(field_map.items()), TIMEZONE, TIMESTAMP_UNIT, EXPLODE)
+    if query is not None:
+        settings += (query.describe(),)
+    if VALIDATE:
+        settings += ('validate',)  # the chunks carry the ANOMALY_COLUMN
+    return iter_cached(path, extract, settings)
+
+
+def _summary_aggregators(columns):
+    """An Aggregator for every one of SUMMARIES the output columns allow"""
+    aggregators = []
+    for name, keys in SUMMARIES.items():
+        # the day is taken from readable_value_date
+        needed = ['readable_value_date' if key == DAY else key for key in keys] + ['credit', 'amount']
+        missing = [column for column in needed if column not in columns]
+        if missing:
+            print(f"Leaving out summary {name!r}, COLUMNS doesn't keep {missing}", file=sys.stderr)
+            continue
+        aggregators.append(Aggregator(name, keys, columns))
+    return aggregators
+
+
+def run_full(input_files=None, output_files=None):
+    """Convert the input files into every output, returns the details for the run summary
+
+    input_files defaults to [INPUT_FILE] and output_files to OUTPUT_FILES. Several input
+    files are merged into the same outputs, one after the other in the order given.
+    """
+    input_files = input_files or [INPUT_FILE]
+    output_files = output_files or OUTPUT_FILES
+    query = make_query(FILTERS, COLUMNS)
+    columns = column_order if query is None else query.columns
+    if ORDER_BY and ORDER_BY[0] not in columns:
+        raise ValueError(f"Can't order by {ORDER_BY[0]!r}, it is not one of the output columns")
+    # what a .db store records as loaded, a filtered, projected or exploded load isn't the usual table of the input
+    source = input_files[0] if len(input_files) == 1 and not (FILTERS or COLUMNS or EXPLODE) else None
+    # Rows go to every output chunk by chunk, the raw batch dicts are dropped as we go.
+    # Opening and closing the outputs (finishing workbooks, Parquet footers) is timed as write:open_close
+    with stage('write:open_close'), ExitStack() as stack:
+        sinks = [stack.enter_context(open_sink(path, columns, source=source, backend=EXCEL_BACKEND,
+                                               width_sample_rows=WIDTH_SAMPLE_ROWS, shard_rows=SHARD_ROWS,
+                                               shard_files=SHARD_FILES, partition_by=PARTITION_BY))
+                 for path in output_files]
+        aggregators = _summary_aggregators(columns)
+        validator = Validator(columns) if VALIDATE else None
+        chunks = itertools.chain.from_iterable(_iter_input_chunks(path, query) for path in input_files)
+        # parse and extract are timed inside a serial run, what is left here is waiting on the workers
+        chunks = timed(chunks, 'extract')
+        if query is not None:
+            chunks = (chunk for chunk in chunks if _chunk_rows(chunk))  # every record of a chunk filtered out
+        if ORDER_BY:
+            chunks = timed(iter_sorted(chunks, *ORDER_BY), 'sort')
+        for chunk in chunks:
+            for path, sink in zip(output_files, sinks):
+                with stage('write:' + sink_format(path)):
+                    sink.write(chunk)
+            _aggregate(aggregators, chunk)
+            _validate(validator, chunk)
+            progress(_chunk_rows(chunk))
+        summaries = _write_summaries(sinks, aggregators)
+        anomalies = _write_anomalies(sinks, validator)
+
+    return {
+        'mode': 'full',
+        'input': input_files[0] if len(input_files) == 1 else input_files,
+        'parser': pick_parser(JSON_PARSER, RECORD_FIELDS)[0],
+        'workers': WORKERS,
+        'columns': columns,
+        'filters': [list(item) for item in FILTERS],
+        'summaries': summaries,
+        'anomalies': anomalies,
+        'outputs': _describe_outputs(output_files, sinks),
+    }
+
+
+def main():
+    if (FILTERS or COLUMNS is not None) and (FOLLOW or INCREMENTAL):
+        raise ValueError("FILTERS and COLUMNS only apply to full runs, not with FOLLOW or INCREMENTAL")
+    with RunStats(PROFILE) as stats:
+        if FOLLOW:
+            details = follow(INPUT_FILE, OUTPUT_FILES, explode=EXPLODE, backend=EXCEL_BACKEND,
+                             width_sample_rows=WIDTH_SAMPLE_ROWS, shard_rows=SHARD_ROWS, shard_files=SHARD_FILES,
+                             partition_by=PARTITION_BY)
         else:
-            # Regular field extraction
-            extracted_data[column_name] = df['posting_instruction_batch'].apply(
-                lambda x: extract_posting_fields(x, field_name)
-            )
-    
-    # ADDED NEW CODE: Extract account_type from instruction_details
-    extracted_data['account_type'] = df['posting_instruction_batch'].apply(
-        lambda x: extract_instruction_detail(x, 'account_type')
-    )
-
-# Extract timestamps - MODIFIED to add correctly formatted timestamps with timezone
-if 'timestamp' in df.columns:
-    # Keep original timestamps
-    extracted_data['value_timestamp'] = df['timestamp']
-    extracted_data['booking_timestamp'] = df['timestamp']
-    
-    # Define the timezone offset (+0200)
-    tz_offset = timezone(timedelta(hours=2))
-    
-    # ADDED NEW CODE: Add readable timestamp columns with correct timezone
-    extracted_data['readable_value_date'] = df['timestamp'].apply(
-        lambda x: datetime.datetime.fromtimestamp(int(x)/1000, tz=tz_offset).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] + ' +0200' 
-        if x and pd.notnull(x) else None
-    )
-    extracted_data['readable_booking_date'] = df['timestamp'].apply(
-        lambda x: datetime.datetime.fromtimestamp(int(x)/1000, tz=tz_offset).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] + ' +0200'
-        if x and pd.notnull(x) else None
-    )
-
-# MODIFIED: Updated column order to include the new readable date columns
-column_order = [
-    'batch_id', 'credit', 'amount', 'denomination', 'account_id', 
-    'account_type',
-    'account_address', 'asset', 'phase', 
-    'internal_account_processing_label', 'posting_instruction_id',
-    'value_timestamp', 'readable_value_date',  # Added readable date after timestamp
-    'booking_timestamp', 'readable_booking_date'  # Added readable date after timestamp
-]
-#order can be customized above as needed
-extracted_data = extracted_data[column_order]
-
-# Print column information
-print("Extracted columns:", extracted_data.columns.tolist())
-print("Number of records:", len(extracted_data))
-
-# Export to Excel with formatting
-with pd.ExcelWriter('transaction_data_fixed_final2.xlsx', engine='openpyxl') as writer:  # Change filename here when needed
-    extracted_data.to_excel(writer, index=False, sheet_name='Transactions')
-    # Auto-adjust column widths
-    for column in extracted_data:
-        column_width = max(extracted_data[column].astype(str).map(len).max(), len(column)) + 2
-        col_idx = extracted_data.columns.get_loc(column)
-        writer.sheets['Transactions'].column_dimensions[chr(65 + col_idx)].width = column_width
-
-print("Excel file created successfully!")
\ No newline at end of file
+            details = run_incremental() if INCREMENTAL else run_full()
+    write_summary(stats.summary(**details), SUMMARY_FILE)
+
+
+if __name__ == '__main__':
+    main()
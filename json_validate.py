@@ -0,0 +1,128 @@
+#Validation in the extraction pass: anomalies counted and sampled per path, written as a report next to the outputs
+#
+# Nothing is read twice. Two kinds of anomaly are found:
+#   structure - records whose first posting isn't where the spec expects it: no committed_postings
+#               (custom_instruction.postings used instead, or missing too), a null custom_instruction,
+#               no posting_instructions or no batch at all. The extractor notes them only in the
+#               branches it already takes for such records (json_extract.py), so a well formed
+#               record costs nothing extra, and the notes ride along with the rows in ANOMALY_COLUMN.
+#   values    - every output column is checked once per chunk for missing (None) values and values
+#               of the wrong type, on the typed and dictionary-encoded buffers where they are, so
+#               only a column that holds anomalies is looked at value by value.
+# Rows are numbered as they are written to the outputs (the first row after the header is 1), after
+# filters and ORDER_BY. The report is added to every output like the SUMMARIES: an 'Anomalies' sheet in
+# a workbook, a summary_anomalies table in a .db and, with TABLE_FILES, a _anomalies file next to the other formats.
+from json_columns import TypedColumn
+from json_extract import (field_map, DictColumn, ANOMALY_COLUMN, MISSING, WRONG_TYPE, TYPED_COLUMNS)
+from json_spec import to_path
+
+REPORT_NAME = 'Anomalies'
+REPORT_COLUMNS = ['path', 'column', 'anomaly', 'count', 'share', 'sample_rows', 'sample_batch_ids', 'sample_values']
+SAMPLES = 5  # example rows kept per anomaly
+# Python types of the values of a column once parsed, columns not listed hold text
+EXPECTED_TYPES = {column: {'int64': (int,), 'bool': (bool,), 'decimal': (str,)}[kind]
+                  for column, kind in TYPED_COLUMNS.items()}
+# Columns where a missing value is normal and not reported, e.g. ('internal_account_processing_label',)
+OPTIONAL_COLUMNS = ()
+_NONE = type(None)
+
+
+def _first(rows, limit):
+    """The first limit positions of an index array or list, as ints"""
+    return [int(row) for row in rows[:limit]]
+
+
+def _column_problems(values, types, limit):
+    """[(anomaly, count, first rows)] for the missing and wrongly typed values of one column"""
+    if isinstance(values, TypedColumn):  # only ever holds values of its kind
+        count = int(values.missing.sum())
+        return [(MISSING, count, _first(values.missing.nonzero()[0], limit))] if count else []
+    problems = []
+    if isinstance(values, DictColumn):
+        wrong = [code for code, value in enumerate(values.dictionary)
+                 if value is not None and type(value) not in types]
+        for anomaly, codes in ((MISSING, [values.dictionary.index(None)] if None in values.dictionary else []),
+                               (WRONG_TYPE, wrong)):
+            if codes:
+                rows = (values.codes[:, None] == codes).any(axis=1).nonzero()[0]
+                problems.append((anomaly, len(rows), _first(rows, limit)))
+        return problems
+    if types == (str,):
+        try:
+            ''.join(values)  # the usual text column, checked in one pass in C
+            return problems
+        except TypeError:  # stops at the first value that isn't text
+            pass
+    kinds = set(map(type, values))
+    if _NONE in kinds:
+        rows = []
+        for row, value in enumerate(values):
+            if value is None:
+                rows.append(row)
+                if len(rows) == limit:
+                    break
+        problems.append((MISSING, values.count(None), rows))
+    if not kinds <= {*types, _NONE}:
+        rows = [row for row, value in enumerate(values) if value is not None and type(value) not in types]
+        problems.append((WRONG_TYPE, len(rows), rows[:limit]))
+    return problems
+
+
+class Validator:
+    """Counts and sample rows of every anomaly in the chunks written, updated chunk by chunk like an Aggregator
+
+    columns are the output columns; the readable dates, which follow value_timestamp, and
+    OPTIONAL_COLUMNS are not checked. Memory stays at SAMPLES rows per anomaly found.
+    """
+
+    def __init__(self, columns, samples=SAMPLES):
+        self.name = REPORT_NAME
+        self.samples = samples
+        self.checks = [(column, to_path(*field_map[column]), EXPECTED_TYPES.get(column, (str,)))
+                       for column in columns if column in field_map and column not in OPTIONAL_COLUMNS]
+        self.found = {}  # (path, column, anomaly) -> [count, sample rows, sample batch ids, sample values]
+        self.rows_seen = 0
+
+    def _add(self, key, count, rows, chunk, values=None):
+        entry = self.found.get(key)
+        if entry is None:
+            entry = self.found[key] = [0, [], [], []]
+        entry[0] += count
+        batch_ids = chunk.get('batch_id')
+        for row in rows[:self.samples - len(entry[1])]:
+            entry[1].append(self.rows_seen + row + 1)
+            entry[2].append(None if batch_ids is None else batch_ids[row])
+            if values is not None:
+                entry[3].append(repr(values[row])[:80])
+
+    def update(self, chunk):
+        """Count the anomalies of one chunk of extracted columns"""
+        for column, path, types in self.checks:
+            values = chunk[column]
+            for anomaly, count, rows in _column_problems(values, types, self.samples):
+                self._add((path, column, anomaly), count, rows, chunk, values if anomaly == WRONG_TYPE else None)
+        notes = chunk.get(ANOMALY_COLUMN)
+        if notes is not None:
+            for row, problems in enumerate(notes):
+                if problems:
+                    for path, anomaly in problems:
+                        self._add((path, None, anomaly), 1, [row], chunk)
+        self.rows_seen += len(next(iter(chunk.values()), ()))
+
+    def columns(self):
+        return list(REPORT_COLUMNS)
+
+    def rows(self):
+        """The report table, the most frequent anomalies first"""
+        table = []
+        for (path, column, anomaly), (count, rows, batch_ids, values) in sorted(
+                self.found.items(), key=lambda item: (-item[1][0], item[0][0], item[0][1] or '', item[0][2])):
+            share = round(count / self.rows_seen, 6) if self.rows_seen else None
+            table.append([path, column, anomaly, count, share, ', '.join(map(str, rows)),
+                          ', '.join(str(batch_id) for batch_id in batch_ids), ' | '.join(values) or None])
+        return table
+
+    def summary(self):
+        """The report for the JSON run summary, with the number of rows checked"""
+        return {'rows_checked': self.rows_seen,
+                'anomalies': [dict(zip(REPORT_COLUMNS, row)) for row in self.rows()]}